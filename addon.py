@@ -12,25 +12,105 @@ Features:
 - Handles image scaling and coordinate normalization
 - Filters overlapping regions
 - Keyboard shortcut: Ctrl+Shift+A
+- Browser: Notes > Auto-Occlude Selected Notes for batch runs
+- Tools > Auto Image Occlusion Timings: per-stage timing summary
+- Tools > Clear Auto Image Occlusion Cache: drop cached OCR results
 
 Architecture:
-- Python backend: Runs OCR using pytesseract
-- JavaScript frontend: Injects button and handles UI
+- Python backend: Runs OCR using pytesseract on a background worker pool
+- JavaScript frontend: web/auto_io.js (served as a web export, loaded once
+  per editor) adds the buttons and handles UI
 - Communication: pycmd() for Python ↔ JavaScript messaging
 - Coordinate system: Normalized (0-1 range) relative to bounding box
 - Hook: editor_mask_editor_did_load_image (precise IO editor timing)
+- Engine session: built and warmed up in the background when the profile
+  opens, rebuilt (with the injected JS) when the config is saved
+- Startup: nothing heavy is imported; a first-run dependency install runs in
+  the background and enables the button when it finishes
 
 Author: Inspired by logseq-anki-sync
 License: GNU AGPL v3+
 """
 
-from aqt import gui_hooks
+from aqt import gui_hooks, mw
+from aqt.qt import QAction
 
+from .batch import on_browser_menus_did_init
+from .dependency_manager import is_ready as dependencies_installed
+from .editor_integration import WEB_EXPORTS
+from .editor_integration import clear_cache as clear_js_cache
+from .editor_integration import enable_button as enable_js_button
 from .editor_integration import on_mask_editor_image_loaded
 from .message_handler import handle_messages
+from .ocr_cache import clear as clear_ocr_cache
+from .ocr_engine import invalidate_session, warm_up
+from .ocr_jobs import shutdown as shutdown_jobs
+from .prefetch import on_editor_did_load_note
+from .tesseract_capi import release_all as release_tesseract_handles
+from .tracing import show_summary as show_timing_summary
+
+
+def on_config_updated(config):
+    """Config saved in the add-on manager: rebuild everything derived from it."""
+    invalidate_session()
+    release_tesseract_handles()
+    clear_js_cache()
+    warm_up()
+
+
+def on_profile_did_open():
+    """Warm up the OCR engine once dependencies are in place."""
+    if dependencies_installed():
+        warm_up()
+
+
+def on_dependencies_installed(ok):
+    """Background install finished (called on the install thread)."""
+    mw.taskman.run_on_main(lambda: _finish_dependency_install(ok))
+
+
+def _finish_dependency_install(ok):
+    if not ok:
+        from aqt.utils import showCritical
+        showCritical(
+            "Failed to install required dependencies.<br>"
+            "Please check your internet connection and restart Anki.",
+            title="Auto Image Occlusion Error",
+        )
+        return
+
+    print("[Auto Image Occlusion] Dependencies ready")
+    clear_js_cache()
+    enable_js_button()
+    if mw.col is not None:
+        warm_up()
+
+
+def on_clear_cache():
+    """Tools menu action: delete every cached OCR result."""
+    from aqt.utils import tooltip
+
+    clear_ocr_cache()
+    tooltip("Auto Image Occlusion: OCR cache cleared")
 
 
 def init():
     """Initialize the addon by registering hooks"""
     gui_hooks.editor_mask_editor_did_load_image.append(on_mask_editor_image_loaded)
     gui_hooks.webview_did_receive_js_message.append(handle_messages)
+    gui_hooks.editor_did_load_note.append(on_editor_did_load_note)
+    gui_hooks.browser_menus_did_init.append(on_browser_menus_did_init)
+    gui_hooks.profile_did_open.append(on_profile_did_open)
+    gui_hooks.profile_will_close.append(shutdown_jobs)
+    gui_hooks.profile_will_close.append(release_tesseract_handles)
+
+    mw.addonManager.setConfigUpdatedAction(__name__, on_config_updated)
+    mw.addonManager.setWebExports(__name__, WEB_EXPORTS)
+
+    action = QAction("Auto Image Occlusion Timings", mw)
+    action.triggered.connect(show_timing_summary)
+    mw.form.menuTools.addAction(action)
+
+    action = QAction("Clear Auto Image Occlusion Cache", mw)
+    action.triggered.connect(on_clear_cache)
+    mw.form.menuTools.addAction(action)
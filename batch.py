@@ -0,0 +1,226 @@
+"""
+Batch Occlusion Module
+Runs auto-detection over many Image Occlusion notes from the Browser
+
+Architecture:
+- Menu: Notes > Auto-Occlude Selected Notes (browser_menus_did_init hook)
+- Detection: QueryOp in the background; notes are OCR'd in parallel on the
+  job pool with a progress dialog, each with its language scope (see
+  language_select) so "auto_lang" probes once per deck
+- Collisions: shapes already in a note's occlusion field go through
+  filter_colliding_regions, same as in the editor
+- Writing: one CollectionOp / update_notes call, so the whole batch is a
+  single undoable transaction
+"""
+
+import re
+from collections import namedtuple
+
+from anki.collection import Collection
+from anki.models import StockNotetype
+from aqt import mw
+from aqt.browser import Browser
+from aqt.operations import CollectionOp, QueryOp
+from aqt.qt import QAction
+from aqt.utils import showWarning, tooltip
+
+from . import image_source, language_select
+from .dependency_manager import is_ready as dependencies_installed
+from .message_handler import filter_colliding_regions
+from .ocr_engine import perform_ocr
+from .ocr_jobs import run_many
+
+# Same top padding the editor adds before creating shapes
+TOP_PADDING_PERCENT = 0.10
+
+# Every IO cloze (text shapes included, so their ordinals count); geometry
+# is only parsed for the kinds in parse_shapes
+_SHAPE_RE = re.compile(r"\{\{c(\d+)::image-occlusion:(\w+)((?::[^:}]+=[^:}]*)*)")
+_NUMBER_RE = re.compile(r"-?\d*\.?\d+")
+
+# CollectionOp accepts any result with a .changes attribute
+BatchResult = namedtuple("BatchResult", ["changes", "added", "updated"])
+
+
+def on_browser_menus_did_init(browser: Browser) -> None:
+    """Hook: add the batch action to the Browser's Notes menu."""
+    action = QAction("Auto-Occlude Selected Notes", browser)
+    action.triggered.connect(lambda: run_batch(browser))
+    browser.form.menu_Notes.addAction(action)
+
+
+def _is_io_notetype(notetype):
+    return (notetype.get("originalStockKind")
+            == StockNotetype.OriginalStockKind.ORIGINAL_STOCK_KIND_IMAGE_OCCLUSION)
+
+
+def _field_indexes(col, notetype):
+    """(occlusion, image) field indexes for an IO notetype."""
+    try:
+        indexes = col.models.get_image_occlusion_field_indexes(notetype)
+        return indexes.occlusions, indexes.image
+    except Exception:
+        return 0, 1
+
+
+def parse_shapes(occlusion_text):
+    """
+    Parse the shapes in an occlusion field.
+
+    Returns:
+        (shapes, max_ordinal) where shapes are normalized
+        {'left', 'top', 'width', 'height'} bounding boxes of the rect,
+        ellipse and polygon shapes, and max_ordinal covers every shape
+    """
+    shapes = []
+    max_ordinal = 0
+    for match in _SHAPE_RE.finditer(occlusion_text):
+        max_ordinal = max(max_ordinal, int(match.group(1)))
+        kind = match.group(2)
+        props = dict(
+            part.split("=", 1) for part in match.group(3).split(":") if "=" in part
+        )
+        try:
+            if kind == "rect":
+                box = (float(props["left"]), float(props["top"]),
+                       float(props["width"]), float(props["height"]))
+            elif kind == "ellipse":
+                box = (float(props["left"]), float(props["top"]),
+                       2 * float(props["rx"]), 2 * float(props["ry"]))
+            elif kind == "polygon":
+                numbers = [float(n) for n in _NUMBER_RE.findall(props.get("points", ""))]
+                xs, ys = numbers[0::2], numbers[1::2]
+                if not xs or not ys:
+                    continue
+                box = (min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+            else:
+                # Other kinds (text labels) have no box to collide with
+                continue
+        except (KeyError, ValueError):
+            continue
+        shapes.append(dict(zip(('left', 'top', 'width', 'height'), box)))
+    return shapes, max_ordinal
+
+
+def _fmt(value):
+    """Format a normalized coordinate the way Anki writes them (e.g. .0543)."""
+    text = f"{min(max(value, 0.0), 1.0):.4f}"
+    return text[1:] if text.startswith("0.") else text
+
+
+def build_occlusions(regions, img_w, img_h, first_ordinal):
+    """Turn a RegionArray (pixels) into IO rect clozes, one ordinal per region."""
+    clozes = []
+    for i, (left, r_top, width, r_height) in enumerate(regions):
+        padding = r_height * TOP_PADDING_PERCENT
+        top = max(0.0, r_top - padding)
+        height = r_top + r_height - top
+        clozes.append(
+            f"{{{{c{first_ordinal + i}::image-occlusion:rect"
+            f":left={_fmt(left / img_w)}:top={_fmt(top / img_h)}"
+            f":width={_fmt(width / img_w)}:height={_fmt(height / img_h)}"
+            f":oi=1}}}}"
+        )
+    return "<br>".join(clozes)
+
+
+def _collect_jobs(col: Collection, nids):
+    """Find the IO notes among nids, the image file and language scope of each."""
+    jobs = []
+    for nid in nids:
+        note = col.get_note(nid)
+        notetype = note.note_type()
+        if not notetype or not _is_io_notetype(notetype):
+            continue
+        _, image_idx = _field_indexes(col, notetype)
+        path = image_source.media_path_for_note(col, note, [note.fields[image_idx]])
+        if path:
+            jobs.append((nid, path, language_select.scope_for_note(col, note)))
+    return jobs
+
+
+def _detect(job):
+    """OCR one note's image. Runs on a job pool worker."""
+    _, path, scope = job
+    image = image_source.open_image(path)
+    return image.size, perform_ocr(image, language_scope=scope)
+
+
+def _detect_all(col: Collection, nids):
+    """Background op: OCR every IO note in nids in parallel."""
+    jobs = _collect_jobs(col, nids)
+    total = len(jobs)
+    results = {}
+    failed = 0
+
+    for done, (job, future) in enumerate(run_many(_detect, jobs), start=1):
+        try:
+            results[job[0]] = future.result()
+        except Exception as e:
+            failed += 1
+            print(f"[Auto Image Occlusion] Batch OCR failed for {job[1]}: {e}")
+        mw.taskman.run_on_main(
+            lambda done=done: mw.progress.update(
+                label=f"Detecting text... {done}/{total}", value=done, max=total
+            )
+        )
+
+    return results, total, failed
+
+
+def _apply_results(col: Collection, results):
+    """Collection op: append detected rectangles to each note's occlusion field."""
+    notes = []
+    added = 0
+    for nid, ((img_w, img_h), regions) in results.items():
+        note = col.get_note(nid)
+        occl_idx, _ = _field_indexes(col, note.note_type())
+        existing, max_ordinal = parse_shapes(note.fields[occl_idx])
+        if existing:
+            regions = filter_colliding_regions(regions, existing, img_w, img_h)
+        if not regions:
+            continue
+
+        new_text = build_occlusions(regions, img_w, img_h, max_ordinal + 1)
+        current = note.fields[occl_idx]
+        note.fields[occl_idx] = f"{current}<br>{new_text}" if current else new_text
+        notes.append(note)
+        added += len(regions)
+
+    return BatchResult(col.update_notes(notes), added, len(notes))
+
+
+def run_batch(browser: Browser) -> None:
+    """Detect and add occlusions for every selected Image Occlusion note."""
+    if not dependencies_installed():
+        tooltip("OCR dependencies are still being installed", parent=browser)
+        return
+
+    nids = browser.selected_notes()
+    if not nids:
+        tooltip("No notes selected", parent=browser)
+        return
+
+    def on_detected(outcome):
+        results, total, failed = outcome
+        if not total:
+            showWarning("None of the selected notes are Image Occlusion notes "
+                        "with an image in the media folder.", parent=browser)
+            return
+
+        def on_written(out):
+            msg = f"Added {out.added} occlusions to {out.updated} of {total} notes"
+            if failed:
+                msg += f" ({failed} failed, see console)"
+            tooltip(msg, parent=browser)
+
+        CollectionOp(
+            parent=browser,
+            op=lambda col: _apply_results(col, results),
+        ).success(on_written).run_in_background()
+
+    QueryOp(
+        parent=browser,
+        op=lambda col: _detect_all(col, nids),
+        success=on_detected,
+    ).with_progress("Detecting text...").run_in_background()
@@ -0,0 +1,374 @@
+"""
+OCR Pipeline Benchmark
+Times every stage of the detection pipeline on a synthetic corpus, outside Anki
+
+Usage:
+    python benchmarks/bench_ocr.py [--repeat N] [--json out.json]
+                                   [--baseline old.json] [--tolerance 0.2]
+                                   [--set key=value ...] [--only name ...]
+
+Requirements: Pillow, pytesseract and a tesseract binary (same as the addon).
+Anki is not needed: aqt is replaced by a stub before the addon is imported.
+
+Corpus:
+- Rendered labels at several font sizes, densities, languages and image
+  resolutions, with the rendered text boxes kept as ground truth
+- Generated in memory on every run from a fixed seed, so runs are comparable
+
+Stages (milliseconds, median over --repeat runs):
+    decode     PNG bytes -> PIL image (Image.open + load)
+    ocr        preprocessing + Tesseract (cache disabled); with
+               --set detector='"fast"' the whole fast detector
+    group      word -> line grouping and tile seam stitching (tesseract only)
+    filter     confidence/size/text-length filtering (tesseract only)
+    merge      vertical merging
+    collide    collision filtering against existing shapes (half the
+               ground truth boxes, as if already occluded)
+
+Quality: a ground truth label counts as found when detections cover at least
+half of it; a detection counts as correct when at least half of it lies on
+ground truth labels.
+
+With --baseline, exits with status 1 if any stage got slower than the
+baseline by more than --tolerance (fraction) or recall dropped by more than
+0.05, so it can gate upgrades of Tesseract, Pillow or the addon itself.
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import types
+import importlib
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "auto_io_bench"
+
+STAGES = ("decode", "ocr", "group", "filter", "merge", "collide")
+
+WORDS = {
+    "eng": ["Aorta", "Left ventricle", "Pulmonary vein", "Mitral valve", "Septum",
+            "Right atrium", "Femur", "Tibia", "Cortex", "Nucleus"],
+    "spa": ["Corazón", "Válvula mitral", "Aurícula derecha", "Pulmón", "Riñón",
+            "Médula espinal", "Estómago", "Hígado"],
+    "fra": ["Cœur", "Oreillette droite", "Poumon gauche", "Rein", "Moelle épinière",
+            "Estomac", "Foie", "Œsophage"],
+    "deu": ["Herz", "Rechter Vorhof", "Lungenvene", "Niere", "Rückenmark",
+            "Magen", "Leber", "Speiseröhre"],
+    "chi_sim": ["主动脉", "左心室", "肺静脉", "二尖瓣", "右心房", "股骨"],
+}
+
+CJK_FONTS = (
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    r"C:\Windows\Fonts\msyh.ttc",
+)
+
+# name, (width, height), font size, label count, language
+SCENARIOS = (
+    ("screenshot-small-sparse", (1280, 800), 18, 12, "eng"),
+    ("screenshot-dense", (1920, 1080), 16, 120, "eng"),
+    ("slide-large-text", (1920, 1080), 48, 20, "eng"),
+    ("scan-tiny-text", (2480, 3508), 11, 150, "eng"),
+    ("plate-4k", (4000, 3000), 28, 200, "eng"),
+    ("plate-8k", (8000, 5000), 32, 400, "eng"),
+    ("spanish", (1920, 1080), 22, 60, "spa"),
+    ("french", (1920, 1080), 22, 60, "fra"),
+    ("german", (1920, 1080), 22, 60, "deu"),
+    ("chinese", (1920, 1080), 26, 40, "chi_sim"),
+)
+
+
+# =============================================================================
+# Import the addon without Anki
+# =============================================================================
+
+def _stub_aqt():
+    """Install a minimal aqt so addon modules import under plain Python."""
+    aqt = types.ModuleType("aqt")
+    aqt.mw = None
+    utils = types.ModuleType("aqt.utils")
+    utils.tooltip = lambda *args, **kwargs: None
+    utils.showWarning = lambda *args, **kwargs: None
+    aqt.utils = utils
+    sys.modules.setdefault("aqt", aqt)
+    sys.modules.setdefault("aqt.utils", utils)
+
+
+def load_addon():
+    """Import the addon's modules as a package without running __init__.py."""
+    _stub_aqt()
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [ADDON_DIR]
+    sys.modules[PACKAGE] = package
+
+    libs = os.path.join(ADDON_DIR, "libs")
+    if os.path.isdir(libs) and libs not in sys.path:
+        sys.path.append(libs)
+
+    return types.SimpleNamespace(
+        engine=importlib.import_module(f"{PACKAGE}.ocr_engine"),
+        data=importlib.import_module(f"{PACKAGE}.ocr_data"),
+        tiling=importlib.import_module(f"{PACKAGE}.tiling"),
+        handler=importlib.import_module(f"{PACKAGE}.message_handler"),
+    )
+
+
+def load_config(overrides):
+    with open(os.path.join(ADDON_DIR, "config.json"), encoding="utf-8") as f:
+        config = json.load(f)
+    for item in overrides:
+        key, _, value = item.partition("=")
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+    # Always measure real recognition
+    config["cache_max_mb"] = 0
+    return config
+
+
+# =============================================================================
+# Synthetic corpus
+# =============================================================================
+
+def _font(size, lang):
+    from PIL import ImageFont
+
+    if lang == "chi_sim":
+        for path in CJK_FONTS:
+            if os.path.isfile(path):
+                return ImageFont.truetype(path, size)
+        return None
+    return ImageFont.load_default(size=size)
+
+
+def _overlaps(box, boxes, margin):
+    l, t, r, b = box
+    return any(
+        not (r + margin < o[0] or l - margin > o[2] or b + margin < o[1] or t - margin > o[3])
+        for o in boxes
+    )
+
+
+def render_scenario(size, font_size, count, lang, seed):
+    """Render labels at random non-overlapping spots; return (png_bytes, truth)."""
+    from PIL import Image, ImageDraw
+
+    font = _font(font_size, lang)
+    if font is None:
+        return None, None
+
+    rnd = random.Random(seed)
+    width, height = size
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+
+    # A little diagram-like clutter so it isn't just text on white
+    for _ in range(count // 4 + 2):
+        x0, y0 = rnd.randrange(width), rnd.randrange(height)
+        draw.line((x0, y0, rnd.randrange(width), rnd.randrange(height)),
+                  fill=(rnd.randrange(80, 200),) * 3, width=2)
+
+    truth = []
+    attempts = 0
+    while len(truth) < count and attempts < count * 20:
+        attempts += 1
+        text = rnd.choice(WORDS[lang])
+        x, y = rnd.randrange(width), rnd.randrange(height)
+        box = draw.textbbox((x, y), text, font=font)
+        if box[2] >= width or box[3] >= height or _overlaps(box, truth, font_size // 2):
+            continue
+        draw.rectangle(box, fill="white")
+        draw.text((x, y), text, font=font, fill="black")
+        truth.append(box)
+
+    buf = io.BytesIO()
+    image.save(buf, "PNG")
+    return buf.getvalue(), truth
+
+
+# =============================================================================
+# Measurement
+# =============================================================================
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def run_pipeline(addon, png, truth, session):
+    """Run every stage once; return (stage_ms, regions_after_merge, final)."""
+    from PIL import Image
+
+    engine, data, tiling, handler = addon.engine, addon.data, addon.tiling, addon.handler
+    ms = {}
+
+    def decode():
+        image = Image.open(io.BytesIO(png))
+        image.load()
+        return image
+
+    image, ms["decode"] = _timed(decode)
+    config = session.config
+    detector = config.get("detector", "tesseract")
+
+    if detector == "tesseract":
+        words, ms["ocr"] = _timed(engine._image_to_data, image, session)
+
+        def group():
+            lines = data.group_lines(words)
+            return tiling.stitch_seams(lines, words.seams)
+
+        lines, ms["group"] = _timed(group)
+        regions, ms["filter"] = _timed(engine._filter_lines, lines, image.size, config)
+    else:
+        regions, ms["ocr"] = _timed(engine.DETECTORS[detector], image, session)
+        ms["group"] = ms["filter"] = 0.0
+    regions, ms["merge"] = _timed(
+        engine._merge_vertically_close, regions, config.get("vertical_merge_factor", 0.65)
+    )
+
+    width, height = image.size
+    existing = [
+        {"left": l / width, "top": t / height, "width": (r - l) / width, "height": (b - t) / height}
+        for l, t, r, b in truth[::2]
+    ]
+    final, ms["collide"] = _timed(
+        handler.filter_colliding_regions, regions, existing, width, height
+    )
+    return ms, regions, final
+
+
+def _intersection(a, b):
+    w = min(a[2], b[2]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[1], b[1])
+    return w * h if w > 0 and h > 0 else 0
+
+
+def score(regions, truth):
+    """Return (precision, recall) of detected regions against ground truth boxes."""
+    boxes = [(l, t, l + w, t + h) for l, t, w, h in regions]
+
+    found = 0
+    for gt in truth:
+        area = (gt[2] - gt[0]) * (gt[3] - gt[1])
+        covered = sum(_intersection(gt, d) for d in boxes)
+        if area and covered / area >= 0.5:
+            found += 1
+
+    correct = 0
+    for d in boxes:
+        area = (d[2] - d[0]) * (d[3] - d[1])
+        on_truth = sum(_intersection(d, gt) for gt in truth)
+        if area and on_truth / area >= 0.5:
+            correct += 1
+
+    precision = correct / len(boxes) if boxes else 1.0
+    recall = found / len(truth) if truth else 1.0
+    return precision, recall
+
+
+def run(args):
+    addon = load_addon()
+    config = load_config(args.set)
+
+    results = {}
+    for index, (name, size, font_size, count, lang) in enumerate(SCENARIOS):
+        if args.only and name not in args.only:
+            continue
+        png, truth = render_scenario(size, font_size, count, lang, seed=index)
+        if png is None:
+            print(f"{name:26} skipped (no font for {lang})")
+            continue
+
+        session = addon.engine.EngineSession(dict(config, tesseract_lang=lang))
+        if session.missing_langs and config.get("detector", "tesseract") == "tesseract":
+            print(f"{name:26} skipped ({lang} traineddata not installed)")
+            continue
+        runs = []
+        for _ in range(args.repeat):
+            ms, regions, final = run_pipeline(addon, png, truth, session)
+            runs.append(ms)
+
+        precision, recall = score(regions, truth)
+        results[name] = {
+            "size": list(size),
+            "labels": len(truth),
+            "regions": len(regions),
+            "after_collide": len(final),
+            "ms": {s: statistics.median(r[s] for r in runs) for s in STAGES},
+            "precision": round(precision, 3),
+            "recall": round(recall, 3),
+        }
+        _print_row(name, results[name])
+
+    return results
+
+
+def _print_header():
+    stages = "".join(f"{s:>9}" for s in STAGES)
+    print(f"{'scenario':26}{stages}{'total':>9}{'prec':>7}{'recall':>7}")
+
+
+def _print_row(name, result):
+    ms = result["ms"]
+    stages = "".join(f"{ms[s]:9.1f}" for s in STAGES)
+    total = sum(ms.values())
+    print(f"{name:26}{stages}{total:9.1f}{result['precision']:7.2f}{result['recall']:7.2f}")
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regression messages (empty if none)."""
+    problems = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        for stage in STAGES:
+            before, after = old["ms"].get(stage, 0), result["ms"][stage]
+            # Ignore sub-millisecond noise
+            if after > 1.0 and after > before * (1 + tolerance):
+                problems.append(f"{name}: {stage} {before:.1f} -> {after:.1f} ms")
+        if result["recall"] < old["recall"] - 0.05:
+            problems.append(f"{name}: recall {old['recall']:.2f} -> {result['recall']:.2f}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario (median)")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against a previous --json file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown per stage as a fraction (default 0.2)")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="override an addon config value (JSON literal)")
+    parser.add_argument("--only", action="append", metavar="NAME",
+                        help="run only the named scenario(s)")
+    args = parser.parse_args(argv)
+
+    _print_header()
+    results = run(args)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+Coverage Module
+Finds the parts of an image that existing occlusions leave uncovered
+
+Used for re-detection on an image that is already mostly occluded: only the
+uncovered parts are OCR'd, so the cost follows the remaining area instead of
+the full image.
+
+Architecture:
+- Grid: the image is split into square cells (about GRID_CELLS along the
+  longer side); a cell is covered when shapes cover all of its sample points
+- Rectangles: runs of uncovered cells in each row are extended downwards
+  while the row below has the same run
+- Budget: rectangles that overlap, and then the pair whose bounding box adds
+  the least extra area, are merged until at most MAX_CROPS remain, so
+  tesseract isn't started dozens of times for a ragged layout
+- Crops: each rectangle is its core; the crop box adds one cell of margin so
+  text cut by a shape edge is still seen whole. Cores don't overlap, so a
+  detection is kept only by the crop whose core holds its centre
+  (tiling.Tile, same ownership rule as tiles)
+- Fallback: fragmented coverage, or crops adding up to most of the image,
+  mean a normal full-image pass (which can also hit the OCR cache)
+"""
+
+import math
+
+from .tiling import Tile
+
+# Cells along the longer image side
+GRID_CELLS = 48
+MIN_CELL = 16
+
+# Coverage samples per cell edge
+SUBCELLS = 4
+
+# Rectangles before merging; beyond this the coverage is too ragged to crop
+MAX_RECTS = 64
+MAX_CROPS = 8
+
+# Use the full image once crops would cover more than this share of it
+MAX_FRACTION = 0.6
+
+
+def uncovered_crops(shapes, img_w, img_h):
+    """
+    Plan crops covering everything the shapes leave visible.
+
+    Args:
+        shapes: Normalized (0-1) shape dicts from the mask editor
+        img_w, img_h: Image size in pixels
+
+    Returns:
+        List of tiling.Tile(box, core) in pixels (empty if everything is
+        covered), or None if a full-image pass is the better choice
+    """
+    if img_w <= 0 or img_h <= 0:
+        return None
+
+    cell = max(MIN_CELL, math.ceil(max(img_w, img_h) / GRID_CELLS))
+    cols, rows = math.ceil(img_w / cell), math.ceil(img_h / cell)
+    covered = _covered_cells(shapes, img_w, img_h, cell, cols, rows)
+
+    rects = _uncovered_rects(covered, cols, rows)
+    if len(rects) > MAX_RECTS:
+        return None
+    rects = _merge_rects(rects, MAX_CROPS)
+
+    crops = []
+    area = 0
+    for left, top, right, bottom in rects:
+        core = (left * cell, top * cell, min(img_w, right * cell), min(img_h, bottom * cell))
+        box = (
+            max(0, core[0] - cell), max(0, core[1] - cell),
+            min(img_w, core[2] + cell), min(img_h, core[3] + cell),
+        )
+        area += (box[2] - box[0]) * (box[3] - box[1])
+        crops.append(Tile(box=box, core=core))
+
+    if area > img_w * img_h * MAX_FRACTION:
+        return None
+    return crops
+
+
+def _covered_cells(shapes, img_w, img_h, cell, cols, rows):
+    """
+    Row-major bytearray, 1 where shapes cover a whole cell.
+
+    Coverage is sampled SUBCELLS x SUBCELLS times per cell, so a cell split
+    between two touching shapes still counts as covered.
+    """
+    step = cell / SUBCELLS
+    fine_cols, fine_rows = cols * SUBCELLS, rows * SUBCELLS
+    fine = bytearray(fine_cols * fine_rows)
+    for shape in shapes:
+        try:
+            left = shape['left'] * img_w
+            top = shape['top'] * img_h
+            right = left + shape['width'] * img_w
+            bottom = top + shape['height'] * img_h
+        except (KeyError, TypeError):
+            continue
+
+        # Samples sit at subcell centres; those past the image edge count
+        # as covered when the shape reaches the edge
+        x0 = max(0, math.ceil(left / step - 0.5))
+        y0 = max(0, math.ceil(top / step - 0.5))
+        x1 = fine_cols if right >= img_w else min(fine_cols, math.floor(right / step - 0.5) + 1)
+        y1 = fine_rows if bottom >= img_h else min(fine_rows, math.floor(bottom / step - 0.5) + 1)
+        if x1 <= x0:
+            continue
+        for y in range(y0, y1):
+            fine[y * fine_cols + x0:y * fine_cols + x1] = b"\x01" * (x1 - x0)
+
+    full = b"\x01" * SUBCELLS
+    covered = bytearray(cols * rows)
+    for cy in range(rows):
+        starts = [(cy * SUBCELLS + k) * fine_cols for k in range(SUBCELLS)]
+        for cx in range(cols):
+            offset = cx * SUBCELLS
+            if all(fine[s + offset:s + offset + SUBCELLS] == full for s in starts):
+                covered[cy * cols + cx] = 1
+    return covered
+
+
+def _uncovered_rects(covered, cols, rows):
+    """Group uncovered cells into (left, top, right, bottom) cell rectangles."""
+    rects = []
+    open_runs = {}  # (x0, x1) -> top row
+    for y in range(rows + 1):
+        runs = set()
+        if y < rows:
+            row = covered[y * cols:(y + 1) * cols]
+            x = 0
+            while x < cols:
+                if row[x]:
+                    x += 1
+                    continue
+                start = x
+                while x < cols and not row[x]:
+                    x += 1
+                runs.add((start, x))
+
+        for run in list(open_runs):
+            if run not in runs:
+                rects.append((run[0], open_runs.pop(run), run[1], y))
+        for run in runs:
+            open_runs.setdefault(run, y)
+    return rects
+
+
+def _merge_rects(rects, limit):
+    """Merge overlapping rectangles, then the cheapest pairs down to limit."""
+    rects = list(rects)
+
+    def union(a, b):
+        return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+    def area(r):
+        return (r[2] - r[0]) * (r[3] - r[1])
+
+    def overlaps(a, b):
+        return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+    while len(rects) > 1:
+        pair = next(
+            ((i, j) for i in range(len(rects)) for j in range(i + 1, len(rects))
+             if overlaps(rects[i], rects[j])),
+            None,
+        )
+        if pair is None:
+            if len(rects) <= limit:
+                break
+            pair = min(
+                ((i, j) for i in range(len(rects)) for j in range(i + 1, len(rects))),
+                key=lambda p: (area(union(rects[p[0]], rects[p[1]]))
+                               - area(rects[p[0]]) - area(rects[p[1]])),
+            )
+        i, j = pair
+        merged = union(rects[i], rects[j])
+        rects[j] = rects[-1]
+        rects.pop()
+        rects[i] = merged
+    return rects
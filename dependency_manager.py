@@ -2,21 +2,32 @@
 Dependency Manager for Auto Image Occlusion Addon
 
 Ensures pytesseract and Pillow are available in the addon's libs/ directory.
+
+Startup only reads a small stamp file (libs/.installed.json) that is written
+after a successful install; nothing is imported. If the stamp is missing or
+names other versions, pip runs on a background thread and the caller is told
+when it is done.
 """
 
+import importlib.util
+import json
 import os
 import platform
 import shutil
 import subprocess
 import sys
+import threading
 
 DEPS = {
     "pytesseract": {"version": "0.3.13", "import_name": "pytesseract"},
     "Pillow": {"version": "10.4.0", "import_name": "PIL"},
 }
 LIBS_DIR = os.path.join(os.path.dirname(__file__), "libs")
+STAMP_PATH = os.path.join(LIBS_DIR, ".installed.json")
 PIP_TIMEOUT = 30
 
+_ready = False
+
 _SYSTEM = platform.system()  # "Linux", "Darwin", "Windows"
 
 
@@ -63,19 +74,52 @@ def _find_pip():
     return None
 
 
-def _is_installed(package):
-    """Check if a package is already in libs/."""
+def _is_installed(package, version):
+    """Check if the pinned version of a package is already in libs/."""
     normalized = package.lower().replace("-", "_")
     if not os.path.isdir(LIBS_DIR):
         return False
     for entry in os.listdir(LIBS_DIR):
         if entry.endswith(".dist-info"):
-            dist_name = entry.split("-", 1)[0].lower().replace("-", "_")
-            if dist_name == normalized:
+            dist_name, _, dist_version = entry[:-len(".dist-info")].partition("-")
+            if dist_name.lower().replace("-", "_") == normalized and dist_version == version:
                 return True
     return False
 
 
+def _expected_stamp():
+    return {package: info["version"] for package, info in DEPS.items()}
+
+
+def _write_stamp():
+    tmp = STAMP_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_expected_stamp(), f)
+    os.replace(tmp, STAMP_PATH)
+
+
+def is_ready():
+    """True once dependencies are known to be installed."""
+    return _ready
+
+
+def dependencies_ready():
+    """
+    Fast startup check: put libs/ on sys.path and compare the install stamp.
+
+    Does not import anything; PIL and pytesseract load on first use.
+    """
+    global _ready
+    if LIBS_DIR not in sys.path:
+        sys.path.append(LIBS_DIR)
+    try:
+        with open(STAMP_PATH, "r", encoding="utf-8") as f:
+            _ready = json.load(f) == _expected_stamp()
+    except (OSError, ValueError):
+        _ready = False
+    return _ready
+
+
 def _install(package, version):
     """Install a pinned package into libs/ via system pip."""
     pip = _find_pip()
@@ -112,19 +156,17 @@ def _install(package, version):
 
 
 def ensure_dependencies():
-    """Ensure all dependencies are installed. Returns True on success."""
+    """Ensure all dependencies are installed (slow: may run pip). Returns True on success."""
+    global _ready
     os.makedirs(LIBS_DIR, exist_ok=True)
 
     if LIBS_DIR not in sys.path:
         sys.path.append(LIBS_DIR)
 
     for package, info in DEPS.items():
-        if _is_installed(package):
-            try:
-                __import__(info["import_name"])
-                continue
-            except ImportError:
-                pass
+        if (_is_installed(package, info["version"])
+                and importlib.util.find_spec(info["import_name"]) is not None):
+            continue
 
         print(f"[Auto Image Occlusion] Installing {package}=={info['version']}...")
         try:
@@ -134,4 +176,27 @@ def ensure_dependencies():
             print(f"[Auto Image Occlusion] Failed to install {package}: {e}")
             return False
 
+    try:
+        _write_stamp()
+    except OSError as e:
+        print(f"[Auto Image Occlusion] Failed to write install stamp: {e}")
+    _ready = True
     return True
+
+
+def install_in_background(on_done):
+    """
+    Run ensure_dependencies() on a background thread.
+
+    Args:
+        on_done: Called as on_done(success) on that thread when finished
+    """
+    def run():
+        try:
+            ok = ensure_dependencies()
+        except Exception as e:
+            print(f"[Auto Image Occlusion] Dependency install failed: {e}")
+            ok = False
+        on_done(ok)
+
+    threading.Thread(target=run, name="AutoIO-Deps", daemon=True).start()
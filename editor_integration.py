@@ -6,23 +6,39 @@ Handles injection of JavaScript into Anki's Image Occlusion editor.
 Architecture:
 - Hook: gui_hooks.editor_mask_editor_did_load_image (precise timing)
 - Timing: 50ms delay after image loads (Svelte components need hydration)
-- Caching: JavaScript built once and reused
+- Script: web/auto_io.js, served via the add-on's web exports
+  (setWebExports in addon.init) and loaded once per webview
+- Caching: the loader JavaScript is built once and reused until the config
+  changes
 - Error handling: Exceptions logged to console
 
-The JavaScript is injected every time an IO image loads, but the JS code
-itself is idempotent and handles re-injection gracefully.
+The loader is eval'd every time an IO image loads; it only calls
+AutoIOAddon.init(), which is idempotent.
 """
 
+import os
+import weakref
+
 from aqt import mw
 from aqt.editor import Editor
 from aqt.qt import QTimer
 
+from . import image_source, prefetch
+from .dependency_manager import is_ready as dependencies_installed
 from .js_builder import build_injection_javascript
 
-# Global cache for compiled JavaScript code
-# Cleared when addon reloads; config changes require addon reload
+# Regex for setWebExports; only the editor script is exposed
+WEB_EXPORTS = r"web/.*\.js"
+SCRIPT_PATH = os.path.join(os.path.dirname(__file__), "web", "auto_io.js")
+
+# Global cache for the loader JavaScript
+# Cleared by clear_cache() when the config is saved
 _cached_js_code = None
 
+# Editors we have injected into, so a finished dependency install can
+# enable their buttons
+_injected_editors = weakref.WeakSet()
+
 
 def on_mask_editor_image_loaded(editor: Editor, path_or_nid) -> None:
     """
@@ -36,16 +52,24 @@ def on_mask_editor_image_loaded(editor: Editor, path_or_nid) -> None:
         path_or_nid: Image path (str) for new notes, or NoteId for existing notes
 
     Flow:
-        1. Build/fetch JavaScript code (cached after first build)
-        2. Short delay for Svelte component hydration
-        3. Inject JavaScript via editor.web.eval()
+        1. Remember the image source so OCR can read the original file,
+           and start a speculative OCR of it if prefetch is enabled
+        2. Build/fetch the loader JavaScript (cached after first build)
+        3. Short delay for Svelte component hydration
+        4. Eval the loader via editor.web.eval(); the first one in a webview
+           adds the editor script, later ones only re-init it
     """
     global _cached_js_code
 
+    image_source.remember(editor, path_or_nid)
+    prefetch.start(editor, path_or_nid)
+
     # Build JavaScript once and cache it (config rarely changes)
     if _cached_js_code is None:
         config = mw.addonManager.getConfig(__name__) or {}
-        _cached_js_code = build_injection_javascript(config)
+        _cached_js_code = build_injection_javascript(
+            config, ready=dependencies_installed(), script_url=_script_url()
+        )
 
     # Short delay for Svelte components to hydrate after image loads
     # The hook fires when image.onload completes, but toolbar/canvas need
@@ -53,6 +77,7 @@ def on_mask_editor_image_loaded(editor: Editor, path_or_nid) -> None:
     def inject_delayed():
         try:
             editor.web.eval(_cached_js_code)
+            _injected_editors.add(editor)
         except Exception as e:
             # Log errors for debugging (visible in Anki's debug console)
             # Not a fatal error - user can still use Anki normally
@@ -63,12 +88,32 @@ def on_mask_editor_image_loaded(editor: Editor, path_or_nid) -> None:
     QTimer.singleShot(50, inject_delayed)
 
 
+def _script_url():
+    """Web export URL of the editor script, versioned by its mtime."""
+    package = mw.addonManager.addonFromModule(__name__)
+    try:
+        version = int(os.path.getmtime(SCRIPT_PATH))
+    except OSError:
+        version = 0
+    return f"/_addons/{package}/web/auto_io.js?v={version}"
+
+
 def clear_cache() -> None:
     """
     Clear the JavaScript cache.
 
-    Call this if config changes and you want to rebuild the JavaScript.
-    Useful for development/testing.
+    Called from the config-updated action so the next image load passes the
+    new config (e.g. a changed shortcut) to AutoIOAddon.init().
     """
     global _cached_js_code
     _cached_js_code = None
+
+
+def enable_button() -> None:
+    """Enable the auto-detect button in every editor it was injected into."""
+    for editor in list(_injected_editors):
+        try:
+            editor.web.eval('window.AutoIOAddon && window.AutoIOAddon.setReady && window.AutoIOAddon.setReady()')
+        except Exception:
+            # Editor window closed
+            _injected_editors.discard(editor)
@@ -0,0 +1,250 @@
+"""
+Fast Detector Module
+Finds text-like regions without recognizing them (detector = "fast")
+
+For occlusion only the boxes matter, so this skips Tesseract entirely.
+
+Architecture:
+- Scale: the typical text height (preprocess.estimate_text_height) sets every
+  size below, so the same parameters work for screenshots and 8K plates
+- Ink: grayscale, shrink until text is ~TEXT_CELLS cells tall, adaptive
+  binarization (preprocess.binarize)
+- Smear: a horizontal-only box reduction joins the letters of a word into
+  solid runs (run-length smoothing done by Pillow in C)
+- Components: ink runs per row are found with a bytes regex, and runs that
+  overlap a run in the row above are unioned (8-connectivity)
+- Text test: components must be at most about one text line tall and
+  reasonably dense; diagram lines, arrows and pictures fail one or the other
+- Lines: neighbouring components at the same height (word gaps) are joined
+  with a GridIndex query, giving one box per label line. Fragments shorter
+  than a line (dots, dashes, accents) only survive as part of a line.
+
+Output is a RegionArray of line boxes in image pixels, like the Tesseract
+path, so vertical merging and collision filtering apply unchanged.
+"""
+
+import math
+import re
+
+from . import preprocess
+from . import tracing
+from .ocr_data import RegionArray
+from .spatial import GridIndex
+
+# Text height in cells after shrinking (enough to separate lines, small enough to be fast)
+TEXT_CELLS = 8
+
+# Used when no text-like rows could be measured
+DEFAULT_TEXT_HEIGHT = 16
+
+# Horizontal smear, as a fraction of text height (letter gaps)
+SMEAR = 0.35
+
+# Component height limits, as fractions of text height
+MIN_HEIGHT = 0.35
+MAX_HEIGHT = 2.5
+
+# Minimum share of a component's box covered by ink cells
+MIN_FILL = 0.25
+
+# Join components on the same line closer than this (fraction of text height)
+WORD_GAP = 0.9
+
+# The opening trims thin ascenders and accents; give back this much on top
+# (fraction of text height)
+TOP_PAD = 0.2
+
+# An ink run, allowing single-cell gaps
+_RUN_RE = re.compile(rb"\x00+(?:\xff\x00+)*")
+
+
+def detect_lines(image, config, text_height=None):
+    """
+    Return a RegionArray of text line boxes in image pixels.
+
+    text_height: the full image's estimate when image is a crop of it
+    """
+    from PIL import ImageFilter
+
+    with tracing.span("binarize"):
+        gray = preprocess.to_grayscale(image)
+        if text_height is None:
+            text_height = preprocess.estimate_text_height(gray)
+        text_height = text_height or DEFAULT_TEXT_HEIGHT
+
+        cell_y = max(1, int(text_height // TEXT_CELLS))
+        small = gray.reduce(cell_y) if cell_y > 1 else gray
+        text_cells = text_height / cell_y
+        ink = preprocess.binarize(small, max(2, text_cells))
+
+        smear = max(1, round(text_cells * SMEAR))
+        if smear > 1:
+            # Any ink in a smear-wide cell keeps it ink
+            ink = ink.reduce((smear, 1)).point(lambda v: 0 if v < 255 else 255)
+        cell_x = cell_y * smear
+
+        # Opening (erode, then dilate ink): smeared words are solid blocks
+        # and survive; lines one or two cells thick vanish, so leader lines
+        # no longer chain labels into one huge component
+        ink = ink.filter(ImageFilter.MaxFilter(3)).filter(ImageFilter.MinFilter(3))
+
+    with tracing.span("components"):
+        boxes = _text_components(ink, text_cells)
+
+    with tracing.span("cluster"):
+        lines = _join_words(boxes, text_cells * WORD_GAP / smear)
+
+    pad = round(text_cells * TOP_PAD)
+    for line in lines:
+        line[1] = max(0, line[1] - pad)
+
+    return _to_regions(lines, cell_x, cell_y, image.size, config)
+
+
+def _components(ink):
+    """
+    Connected components of black cells.
+
+    Returns:
+        List of [left, top, right, bottom, ink_cells] with right/bottom exclusive
+    """
+    width, height = ink.size
+    data = ink.tobytes()
+    finditer = _RUN_RE.finditer
+
+    parent = []
+    run_y = []
+    run_start = []
+    run_end = []
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    previous = []  # (start, end, run index) in the row above
+    for y in range(height):
+        offset = y * width
+        current = []
+        p = 0
+        for match in finditer(data, offset, offset + width):
+            start, end = match.start() - offset, match.end() - offset
+            index = len(parent)
+            parent.append(index)
+            run_y.append(y)
+            run_start.append(start)
+            run_end.append(end)
+            current.append((start, end, index))
+
+            # Skip runs above that end before this one starts (diagonals touch)
+            while p < len(previous) and previous[p][1] < start:
+                p += 1
+            q = p
+            while q < len(previous) and previous[q][0] <= end:
+                ra, rb = find(index), find(previous[q][2])
+                if ra != rb:
+                    parent[ra] = rb
+                q += 1
+        previous = current
+
+    stats = {}
+    for index in range(len(parent)):
+        root = find(index)
+        y, start, end = run_y[index], run_start[index], run_end[index]
+        box = stats.get(root)
+        if box is None:
+            stats[root] = [start, y, end, y + 1, end - start]
+            continue
+        if start < box[0]:
+            box[0] = start
+        if end > box[2]:
+            box[2] = end
+        if y + 1 > box[3]:
+            box[3] = y + 1
+        box[4] += end - start
+    return list(stats.values())
+
+
+def _text_components(ink, text_cells):
+    """
+    Components that look like (parts of) one line of text.
+
+    Returns:
+        List of (left, top, right, bottom, is_fragment) where fragments are
+        shorter than a text line
+    """
+    min_h = max(2, text_cells * MIN_HEIGHT)
+    max_h = text_cells * MAX_HEIGHT
+    kept = []
+    for left, top, right, bottom, cells in _components(ink):
+        h = bottom - top
+        if h > max_h or cells < (right - left) * h * MIN_FILL:
+            continue
+        kept.append((left, top, right, bottom, h < min_h))
+    return kept
+
+
+def _join_words(components, gap):
+    """Union boxes that sit on the same line within gap of each other."""
+    boxes = [c[:4] for c in components]
+
+    gap = max(1, math.ceil(gap))
+    index = GridIndex(boxes)
+    parent = list(range(len(boxes)))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, (left, top, right, bottom) in enumerate(boxes):
+        h = bottom - top
+        for j in index.query((left - gap, top, right + gap, bottom)):
+            if j <= i:
+                continue
+            other = boxes[j]
+            other_h = other[3] - other[1]
+            overlap = min(bottom, other[3]) - max(top, other[1])
+            # Same line: mostly overlapping rows and similar heights, or a
+            # fragment (dot, dash) within the other's rows
+            if overlap < 0.5 * min(h, other_h):
+                continue
+            if (max(h, other_h) <= 2 * min(h, other_h)
+                    or components[i][4] or components[j][4]):
+                ra, rb = find(i), find(j)
+                if ra != rb:
+                    parent[ra] = rb
+
+    groups = {}
+    for i, box in enumerate(boxes):
+        root = find(i)
+        group = groups.get(root)
+        if group is None:
+            groups[root] = list(box) + [components[i][4]]
+        else:
+            group[0] = min(group[0], box[0])
+            group[1] = min(group[1], box[1])
+            group[2] = max(group[2], box[2])
+            group[3] = max(group[3], box[3])
+            group[4] = group[4] and components[i][4]
+    # Groups made only of fragments aren't text
+    return [group[:4] for group in groups.values() if not group[4]]
+
+
+def _to_regions(lines, cell_x, cell_y, image_size, config):
+    """Scale cell boxes to pixels and apply the size filters."""
+    img_w, img_h = image_size
+    min_area = img_w * img_h * config.get('min_area_percent', 0.0001)
+    min_w = config.get('min_width', 4)
+    min_h = config.get('min_height', 4)
+
+    regions = RegionArray()
+    for left, top, right, bottom in sorted(lines, key=lambda b: (b[1], b[0])):
+        x0, y0 = left * cell_x, top * cell_y
+        x1, y1 = min(img_w, right * cell_x), min(img_h, bottom * cell_y)
+        w, h = x1 - x0, y1 - y0
+        if w >= min_w and h >= min_h and w * h >= min_area:
+            regions.append(x0, y0, w, h)
+    return regions
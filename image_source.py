@@ -0,0 +1,82 @@
+"""
+Image Source Module
+Locates the original image file behind the IO editor so OCR can read it directly
+
+Architecture:
+- The editor_mask_editor_did_load_image hook reports path_or_nid; we remember
+  it per Editor (weakly, so closed editors are dropped)
+- New notes: path_or_nid is the file the user picked
+- Existing notes: path_or_nid is a NoteId; the image lives in the media folder
+  and is referenced from one of the note's fields
+- Resolution touches the collection, so it must run on the main thread.
+  Opening the file is safe on any thread.
+"""
+
+import os
+import weakref
+
+from aqt import mw
+
+IMAGE_EXTENSIONS = (
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp", ".tif", ".tiff", ".avif",
+)
+
+_sources = weakref.WeakKeyDictionary()
+
+
+def remember(editor, path_or_nid):
+    """Record the image the mask editor just loaded."""
+    _sources[editor] = path_or_nid
+
+
+def resolve_path(editor):
+    """
+    Return an absolute path to the editor's current IO image, or None.
+
+    Must be called on the main thread (reads the collection for existing notes).
+    """
+    try:
+        source = _sources.get(editor)
+    except TypeError:
+        return None
+    if source is None:
+        return None
+
+    if isinstance(source, str):
+        return source if os.path.isfile(source) else None
+
+    if not mw or not mw.col:
+        return None
+    try:
+        note = mw.col.get_note(source)
+    except Exception:
+        return None
+    return media_path_for_note(mw.col, note)
+
+
+def media_path_for_note(col, note, fields=None):
+    """
+    Find the first image file referenced by a note's fields.
+
+    Args:
+        col: Collection
+        note: Note to inspect
+        fields: Field contents to search (defaults to all of the note's fields)
+    """
+    media_dir = col.media.dir()
+    for field in note.fields if fields is None else fields:
+        for filename in col.media.files_in_str(note.mid, field):
+            if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            path = os.path.join(media_dir, filename)
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+def open_image(path):
+    """Open an image file the way the browser displays it (EXIF orientation applied)."""
+    from PIL import Image, ImageOps
+
+    image = Image.open(path)
+    return ImageOps.exif_transpose(image)
@@ -0,0 +1,200 @@
+"""
+Language Selection Module
+Picks the smallest subset of the configured Tesseract languages that fits
+an image (config "auto_lang"), instead of running every model on every word
+
+Architecture:
+- Scope: a choice is remembered per deck (the Add window's deck chooser, or
+  the edited card's deck), falling back to the note type; resolved on the
+  main thread with the rest of the request (or prefetch). Browser batch
+  runs use the note's first card's deck, as when that note is edited.
+- Probe: fast_detector finds text lines; the widest SAMPLE_LINES of them
+  are stacked into one small sample image, recognized once per candidate
+  language
+- Score: word confidence weighted by text length. The best language is
+  kept, plus any within SCORE_MARGIN of it; if no language reaches
+  MIN_SCORE, every candidate is used and nothing is remembered. Requests
+  for one scope probe one at a time, so parallel batch jobs wait for the
+  first probe instead of repeating it
+- Memory: user_files/languages.json, {scope: {"candidates", "lang"}}. An
+  entry only applies while the configured languages are the same.
+"""
+
+import json
+import os
+import threading
+
+from . import fast_detector
+from . import preprocess
+from . import tracing
+
+STORE_PATH = os.path.join(os.path.dirname(__file__), "user_files", "languages.json")
+
+SAMPLE_LINES = 6
+SAMPLE_WIDTH = 1200
+SAMPLE_GAP = 12
+
+SCORE_MARGIN = 5
+MIN_SCORE = 40
+
+_lock = threading.Lock()
+_store = None
+
+# scope -> Lock held while that scope is probed
+_scope_locks = {}
+
+
+def scope_for_editor(editor):
+    """
+    Return the key a language choice is remembered under, or None.
+
+    Must be called on the main thread.
+    """
+    try:
+        deck_chooser = getattr(getattr(editor, 'parentWindow', None), 'deck_chooser', None)
+        if deck_chooser is not None:
+            return f"deck:{deck_chooser.selected_deck_id}"
+        card = getattr(editor, 'card', None)
+        if card is not None:
+            return f"deck:{card.did}"
+        note = getattr(editor, 'note', None)
+        if note is not None:
+            return f"notetype:{note.mid}"
+    except Exception:
+        pass
+    return None
+
+
+def scope_for_note(col, note):
+    """
+    Return the key for a note outside the editor: the scope editing it
+    would use (its first card's deck, else its note type).
+
+    Needs collection access (main thread or a collection op).
+    """
+    card_ids = note.card_ids()
+    if card_ids:
+        return f"deck:{col.get_card(card_ids[0]).did}"
+    return f"notetype:{note.mid}"
+
+
+def choose(image, session, scope, recognize):
+    """
+    Return the language string to OCR image with.
+
+    Args:
+        session: ocr_engine.EngineSession; its lang lists the candidates
+        scope: Key from scope_for_editor or scope_for_note, or None to probe
+            without remembering
+        recognize: fn(image, session) -> WordTable
+    """
+    candidates = [lang for lang in session.lang.split('+') if lang and lang != 'osd']
+    if len(candidates) < 2:
+        return session.lang
+
+    if scope is None:
+        return _choose(image, session, scope, candidates, recognize)
+    with _lock:
+        scope_lock = _scope_locks.setdefault(scope, threading.Lock())
+    with scope_lock:
+        return _choose(image, session, scope, candidates, recognize)
+
+
+def _choose(image, session, scope, candidates, recognize):
+    if scope is not None:
+        entry = _load().get(scope)
+        if entry and entry.get('candidates') == session.lang:
+            tracing.note(lang_source='remembered')
+            return entry['lang']
+
+    with tracing.span("language"):
+        lang = _probe(image, session, candidates, recognize)
+    tracing.note(lang_source='probe')
+
+    if lang is not None and scope is not None:
+        _remember(scope, session.lang, lang)
+    return lang or session.lang
+
+
+def _probe(image, session, candidates, recognize):
+    """Score each candidate on a sample of the image; None if nothing fits."""
+    sample = _sample(image, session.config)
+    if sample is None:
+        return None
+
+    scores = {}
+    for lang in candidates:
+        scores[lang] = _score(recognize(sample, session.with_lang(lang)))
+    tracing.note(lang_scores={lang: round(score, 1) for lang, score in scores.items()})
+
+    best = max(scores.values())
+    if best < MIN_SCORE:
+        return None
+    chosen = sorted((lang for lang in candidates if scores[lang] >= best - SCORE_MARGIN),
+                    key=scores.get, reverse=True)
+    return '+'.join(chosen)
+
+
+def _sample(image, config):
+    """Stack the widest detected text lines into one small image, or None."""
+    from PIL import Image
+
+    lines = sorted(fast_detector.detect_lines(image, dict(config, min_area_percent=0)),
+                   key=lambda box: box[2], reverse=True)[:SAMPLE_LINES]
+    if not lines:
+        return None
+
+    gray = preprocess.to_grayscale(image)
+    crops = []
+    for left, top, width, height in sorted(lines, key=lambda box: box[1]):
+        pad = max(2, height // 5)
+        crops.append(gray.crop((
+            max(0, left - pad), max(0, top - pad),
+            min(image.size[0], left + min(width, SAMPLE_WIDTH) + pad),
+            min(image.size[1], top + height + pad),
+        )))
+
+    width = max(crop.size[0] for crop in crops)
+    height = sum(crop.size[1] for crop in crops) + SAMPLE_GAP * (len(crops) + 1)
+    # Background: the lightest of the crops' corner pixels
+    background = max(crop.getpixel((0, 0)) for crop in crops)
+    sample = Image.new("L", (width, height), background)
+    y = SAMPLE_GAP
+    for crop in crops:
+        sample.paste(crop, (0, y))
+        y += crop.size[1] + SAMPLE_GAP
+
+    prepared, _ = preprocess.prepare(sample, config)
+    return prepared
+
+
+def _score(words):
+    """Mean word confidence, weighted by text length (0 without words)."""
+    total = sum(words.text_len)
+    if not total:
+        return 0.0
+    return sum(conf * length for conf, length in zip(words.conf, words.text_len)) / total
+
+
+def _load():
+    global _store
+    with _lock:
+        if _store is None:
+            try:
+                with open(STORE_PATH, encoding="utf-8") as f:
+                    _store = json.load(f)
+            except (OSError, ValueError):
+                _store = {}
+        return _store
+
+
+def _remember(scope, candidates, lang):
+    store = _load()
+    with _lock:
+        store[scope] = {'candidates': candidates, 'lang': lang}
+        try:
+            os.makedirs(os.path.dirname(STORE_PATH), exist_ok=True)
+            with open(STORE_PATH, "w", encoding="utf-8") as f:
+                json.dump(store, f, indent=1, sort_keys=True)
+        except OSError as e:
+            print(f"[Auto Image Occlusion] Failed to save language choice: {e}")
@@ -1,52 +1,97 @@
 """
 Message Handler Module
 Handles communication between JavaScript and Python via pycmd()
+
+Every OCR request carries a requestId that is echoed in the reply. JS sends
+autoDetectCancel with that id when it gives up (timeout, image reset); the
+job's CancelToken then kills its tesseract processes and no reply is sent.
+
+While OCR runs, boxes that are final are pushed early as
+{requestId, partial: true, regions} messages (already collision-filtered);
+the closing reply carries only the boxes not streamed yet.
+
+Images that aren't in the media folder yet are uploaded from the canvas
+first: the PNG arrives as autoDetectChunk:<uploadId>:<index>:<base64>
+messages (bounded size, decoded as they arrive) and the OCR request then
+names the upload in imageUpload.
+
+A request may carry roi, a normalized rectangle the user dragged ("detect
+in selection"): only that crop is OCR'd and boxes come back in image pixels.
 """
 
-import base64
+import binascii
 import io
 import json
+import math
+import time
+from collections import OrderedDict
+from aqt import mw
 from aqt.utils import tooltip
 
-from .ocr_engine import perform_ocr
+from . import coverage, image_source, language_select, prefetch, tracing
+from .dependency_manager import is_ready as dependencies_installed
+from .ocr_data import RegionArray
+from .ocr_engine import get_session, perform_ocr
+from .ocr_jobs import CancelToken, activate, check_cancelled, submit
+from .spatial import GridIndex
+from .tiling import Tile
 
 PREFIX_OCR = "autoDetectOCR:"
 PREFIX_DONE = "autoDetect:"
+PREFIX_CANCEL = "autoDetectCancel:"
+PREFIX_CHUNK = "autoDetectChunk:"
 
+# requestId -> (CancelToken, Future) for jobs that haven't replied yet.
+# Only touched on the main thread.
+_jobs = {}
 
-def _rects_collide(a, b):
-    """Check if two rectangles intersect."""
-    return not (
-        a['top'] + a['height'] < b['top'] or
-        a['top'] > b['top'] + b['height'] or
-        a['left'] + a['width'] < b['left'] or
-        a['left'] > b['left'] + b['width']
-    )
+# uploadId -> decoded chunks of canvas uploads not yet claimed by a request.
+# Only touched on the main thread; abandoned uploads are evicted oldest first.
+_uploads = OrderedDict()
+MAX_UPLOADS = 2
 
 
-def _send_to_js(context, payload):
+def _send_to_js(context, payload, request_id=None):
     """Send a JSON payload back to JavaScript via the callback."""
-    data = json.dumps(payload)
-    if hasattr(context, 'web'):
-        context.web.eval(f'window.autoIOCallback && window.autoIOCallback({data})')
+    if request_id is not None:
+        payload['requestId'] = request_id
+    with tracing.span("deliver"):
+        data = json.dumps(payload)
+        if hasattr(context, 'web'):
+            try:
+                context.web.eval(f'window.autoIOCallback && window.autoIOCallback({data})')
+            except RuntimeError:
+                # Editor was closed while the job was running
+                pass
 
 
 def filter_colliding_regions(regions, existing_shapes, img_width, img_height):
-    """Filter out regions that collide with existing shapes."""
-    existing = [
-        {
-            'left': s['left'] * img_width,
-            'top': s['top'] * img_height,
-            'width': s['width'] * img_width,
-            'height': s['height'] * img_height,
-        }
+    """Filter out regions that collide with existing shapes.
+
+    This is the only collision filter: the injected JS trusts the result.
+
+    Args:
+        regions: RegionArray in image pixels
+        existing_shapes: Normalized (0-1) shape dicts from the mask editor
+    """
+    if not existing_shapes:
+        return regions
+
+    index = GridIndex(
+        (
+            s['left'] * img_width,
+            s['top'] * img_height,
+            (s['left'] + s['width']) * img_width,
+            (s['top'] + s['height']) * img_height,
+        )
         for s in existing_shapes
-    ]
+    )
 
-    return [
-        r for r in regions
-        if not any(_rects_collide(r, e) for e in existing)
-    ]
+    kept = RegionArray()
+    for left, top, width, height in regions:
+        if not index.intersects_any((left, top, left + width, top + height)):
+            kept.append(left, top, width, height)
+    return kept
 
 
 def handle_messages(handled, message, context):
@@ -54,10 +99,18 @@ def handle_messages(handled, message, context):
     if not isinstance(message, str):
         return handled
 
+    if message.startswith(PREFIX_CHUNK):
+        _receive_chunk(message)
+        return (True, None)
+
     if message.startswith(PREFIX_OCR):
         _process_ocr(message, context)
         return (True, None)
 
+    if message.startswith(PREFIX_CANCEL):
+        _cancel_job(message)
+        return (True, None)
+
     if message.startswith(PREFIX_DONE):
         _show_completion(message)
         return (True, None)
@@ -66,37 +119,309 @@ def handle_messages(handled, message, context):
 
 
 def _process_ocr(message, context):
-    """Decode image, run OCR, filter collisions, send results back."""
+    """Parse the request and hand OCR off to the worker pool.
+
+    Runs on the Qt main thread (inside the pycmd hook), so it must return
+    quickly; decoding and recognition happen in _run_ocr on a worker thread.
+
+    Requests without imageUpload ask us to read the original file from
+    disk. If we can't find it, JS is told to upload the canvas pixels.
+    """
+    started = time.perf_counter()
+    try:
+        request = json.loads(message[len(PREFIX_OCR):])
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        _send_to_js(context, {'error': traceback.format_exc()})
+        return
+
+    request_id = request.get('requestId')
+    if not dependencies_installed():
+        _send_to_js(context, {'error': 'OCR dependencies are still being installed'}, request_id)
+        return
+
+    trace = tracing.begin(request.get('traceId'))
+    with tracing.activate(trace):
+        tracing.note(request_bytes=len(message), image_size=[
+            request.get('imageWidth', 0), request.get('imageHeight', 0)
+        ])
+        if trace is not None:
+            trace.add("parse", (time.perf_counter() - started) * 1000)
+
+        upload = request.pop('imageUpload', None)
+        if upload:
+            request['imageChunks'] = _take_upload(upload)
+            if request['imageChunks'] is None:
+                _send_to_js(context, {'error': 'Image upload was incomplete'}, request_id)
+                return
+            tracing.note(upload_bytes=upload.get('bytes', 0), upload_chunks=upload.get('chunks', 0))
+        else:
+            with tracing.span("resolve_path"):
+                request['imagePath'] = image_source.resolve_path(context)
+            if not request['imagePath']:
+                _send_to_js(context, {'needImage': True}, request_id)
+                return
+
+    prefetched = None
+    if request.get('imagePath'):
+        prefetched = prefetch.lookup(context, request['imagePath'])
+
+    # Reads the editor's deck/note type, so resolve it here on the main thread
+    request['languageScope'] = language_select.scope_for_editor(context)
+
+    queued = time.perf_counter()
+    token = CancelToken()
+
+    def emit(payload):
+        # Called on worker threads with a partial batch
+        def send():
+            if not token.cancelled:
+                _send_to_js(context, payload, request_id)
+        mw.taskman.run_on_main(send)
+
+    def task():
+        with tracing.activate(trace), activate(token):
+            if trace is not None:
+                trace.add("queue", (time.perf_counter() - queued) * 1000)
+            return _run_ocr(request, prefetched, emit)
+
+    def done(future):
+        _jobs.pop(request_id, None)
+        if token.cancelled:
+            # JS has given up on this request; a reply would land in
+            # whatever it is doing now
+            return
+        with tracing.activate(trace):
+            _deliver_result(context, future, request_id)
+
+    future = submit(task, done)
+    if request_id is not None:
+        _jobs[request_id] = (token, future)
+
+
+def _receive_chunk(message):
+    """Decode and store one chunk of a canvas upload."""
+    try:
+        upload_id, index, data = message[len(PREFIX_CHUNK):].split(':', 2)
+        index = int(index)
+    except ValueError:
+        return
+
+    chunks = _uploads.get(upload_id)
+    if chunks is None:
+        if index != 0:
+            return
+        chunks = _uploads[upload_id] = []
+        while len(_uploads) > MAX_UPLOADS:
+            _uploads.popitem(last=False)
+
+    # pycmd delivers in order; a gap means the upload can't be used
+    if index != len(chunks):
+        _uploads.pop(upload_id, None)
+        return
+    try:
+        chunks.append(binascii.a2b_base64(data))
+    except binascii.Error:
+        _uploads.pop(upload_id, None)
+
+
+def _take_upload(upload):
+    """Claim a finished upload's chunks, or None if it is missing or incomplete."""
+    chunks = _uploads.pop(upload.get('id'), None)
+    if chunks is None or len(chunks) != upload.get('chunks'):
+        return None
+    if sum(len(chunk) for chunk in chunks) != upload.get('bytes'):
+        return None
+    return chunks
+
+
+def _cancel_job(message):
+    """Cancel a running or queued OCR job on request from JS."""
+    try:
+        request_id = json.loads(message[len(PREFIX_CANCEL):]).get('requestId')
+    except ValueError:
+        return
+    job = _jobs.pop(request_id, None)
+    if job is None:
+        return
+    token, future = job
+    token.cancel()
+    future.cancel()
+
+
+def _load_request_image(request):
+    """Return the PIL image for a request, or None if JS must send pixels."""
+    from PIL import Image
+
+    path = request.get('imagePath')
+    if path:
+        try:
+            image = image_source.open_image(path)
+        except OSError:
+            return None
+        # The file on disk must be what the editor is showing
+        if image.size != (request.get('imageWidth'), request.get('imageHeight')):
+            return None
+        return image
+
+    # One join into bytes; BytesIO shares an immutable bytes buffer
+    # instead of copying it
+    chunks = request.get('imageChunks') or ()
+    data = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+    return Image.open(io.BytesIO(data))
+
+
+def _prefetched_regions(future, size):
+    """Regions from a finished prefetch of this image, or None."""
+    tracing.note(prefetch='ready')
+    try:
+        prefetched_size, regions = future.result()
+    except Exception:
+        # Cancelled (image changed) or failed; the caller runs OCR itself
+        tracing.note(prefetch='failed')
+        return None
+    if prefetched_size != size:
+        tracing.note(prefetch='stale')
+        return None
+    return regions
+
+
+def _roi_box(roi, size):
+    """Pixel box (left, top, right, bottom) of a normalized selection, or None."""
+    if not roi:
+        return None
+    img_w, img_h = size
     try:
-        data = json.loads(message[len(PREFIX_OCR):])
-        image_data = data.get('imageData', '')
-        existing = data.get('existingShapes', [])
-        img_w = data.get('imageWidth', 0)
-        img_h = data.get('imageHeight', 0)
+        left = min(max(float(roi['left']), 0.0), 1.0)
+        top = min(max(float(roi['top']), 0.0), 1.0)
+        right = min(left + float(roi['width']), 1.0)
+        bottom = min(top + float(roi['height']), 1.0)
+    except (KeyError, TypeError, ValueError):
+        return None
+    box = (int(left * img_w), int(top * img_h),
+           math.ceil(right * img_w), math.ceil(bottom * img_h))
+    if box[2] <= box[0] or box[3] <= box[1]:
+        return None
+    return box
 
-        if ',' in image_data:
-            image_data = image_data.split(',', 1)[1]
 
-        from PIL import Image
-        image = Image.open(io.BytesIO(base64.b64decode(image_data)))
+def _regions_in(regions, box):
+    """Regions whose centre lies inside box (same rule as a crop's core)."""
+    left, top, right, bottom = box
+    kept = RegionArray()
+    for r_left, r_top, width, height in regions:
+        if left <= r_left + width / 2 < right and top <= r_top + height / 2 < bottom:
+            kept.append(r_left, r_top, width, height)
+    return kept
 
-        regions = perform_ocr(image)
 
-        if existing and img_w > 0 and img_h > 0:
-            regions = filter_colliding_regions(regions, existing, img_w, img_h)
+def _plan_crops(existing, size):
+    """Crops of the still uncovered area for an incremental re-detect, or None."""
+    if not existing:
+        return None
+    if not get_session().config.get('incremental', True):
+        return None
+    with tracing.span("coverage"):
+        crops = coverage.uncovered_crops(existing, *size)
+    if crops is not None:
+        covered = sum((c.box[2] - c.box[0]) * (c.box[3] - c.box[1]) for c in crops)
+        tracing.note(crop_fraction=round(covered / (size[0] * size[1]), 3))
+    return crops
 
-        _send_to_js(context, {'regions': regions})
 
+def _run_ocr(request, prefetched=None, emit=None):
+    """
+    Load image, run OCR, filter collisions. Runs on a worker thread.
+
+    emit, if given, sends a partial payload to JS; streamed boxes are left
+    out of the returned payload.
+
+    prefetched is a future from prefetch.lookup; its regions are used
+    instead of running OCR when they are for the image the editor shows.
+    A selection (roi) replaces incremental cropping; prefetched regions are
+    narrowed to it.
+    """
+    existing = request.get('existingShapes', [])
+    img_w = request.get('imageWidth', 0)
+    img_h = request.get('imageHeight', 0)
+
+    roi = _roi_box(request.get('roi'), (img_w, img_h))
+    if roi is not None:
+        tracing.note(roi_fraction=round(
+            (roi[2] - roi[0]) * (roi[3] - roi[1]) / (img_w * img_h), 3
+        ))
+
+    regions = None
+    if prefetched is not None:
+        regions = _prefetched_regions(prefetched, (img_w, img_h))
+        if regions is not None and roi is not None:
+            regions = _regions_in(regions, roi)
+
+    if regions is None:
+        with tracing.span("decode"):
+            image = _load_request_image(request)
+            if image is not None:
+                # Force decoding here so it isn't billed to OCR
+                image.load()
+        if image is None:
+            return {'needImage': True}
+        tracing.note(source='file' if request.get('imagePath') else 'canvas')
+        check_cancelled()
+
+        if roi is not None:
+            crops = [Tile(box=roi, core=roi)]
+        else:
+            crops = _plan_crops(existing, image.size)
+
+        if emit is not None and get_session().config.get('stream_results', True):
+            streamed = []
+
+            def on_batch(batch):
+                batch = _collide(batch, existing, img_w, img_h)
+                if batch:
+                    streamed.append(len(batch))
+                    emit({'partial': True, 'regions': batch.to_dicts()})
+
+            perform_ocr(image, crops, on_batch, request.get('languageScope'))
+            tracing.note(existing_shapes=len(existing), regions_returned=sum(streamed),
+                         partial_batches=len(streamed))
+            return {'regions': []}
+
+        regions = perform_ocr(image, crops, language_scope=request.get('languageScope'))
+
+    regions = _collide(regions, existing, img_w, img_h)
+    tracing.note(existing_shapes=len(existing), regions_returned=len(regions))
+    return {'regions': regions.to_dicts()}
+
+
+def _collide(regions, existing, img_w, img_h):
+    """filter_colliding_regions, traced and skipped when there is nothing to hit."""
+    if existing and img_w > 0 and img_h > 0:
+        with tracing.span("collide"):
+            return filter_colliding_regions(regions, existing, img_w, img_h)
+    return regions
+
+
+def _deliver_result(context, future, request_id=None):
+    """Send a finished job's result (or its error) back to JavaScript."""
+    try:
+        payload = future.result()
     except Exception:
         import traceback
         traceback.print_exc()
-        _send_to_js(context, {'error': traceback.format_exc()})
+        payload = {'error': traceback.format_exc()}
+    _send_to_js(context, payload, request_id)
 
 
 def _show_completion(message):
-    """Show tooltip when detection completes."""
+    """Show tooltip when detection completes, and close its trace."""
     try:
         data = json.loads(message[len(PREFIX_DONE):])
+        tracing.finish(
+            data.get("traceId"), data.get("status"), data.get("timings"),
+            regions_added=data.get("count", 0), shape_batches=data.get("batches", 0),
+        )
         if data.get("status") == "complete":
             count = data.get("count", 0)
             tooltip(f"Added {count} auto-detected occlusions" if count else "No new regions detected")
@@ -0,0 +1,158 @@
+"""
+OCR Cache Module
+Content-addressed on-disk cache for raw Tesseract word data
+
+Architecture:
+- Key: hash of the decoded pixels plus every setting that changes Tesseract's
+  output (language, PSM, engine version). Filter/merge settings are applied
+  after the cache, so tweaking them never invalidates entries.
+- Value: the word-level columns (ocr_data.WordTable.to_json), stored as JSON
+- Location: user_files/ocr_cache/ (preserved across addon updates)
+- Eviction: least recently used first, once the total size exceeds the cap.
+  File mtime is the recency stamp; hits touch the file.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "user_files", "ocr_cache")
+
+# Bump when the stored format changes so old entries are ignored
+CACHE_FORMAT = 2
+
+_lock = threading.Lock()
+_total_bytes = None
+_hits = 0
+_misses = 0
+
+
+def make_key(image, params):
+    """
+    Build a cache key for an image and the OCR-relevant parameters.
+
+    Args:
+        image: PIL Image (hashed by decoded pixels, so PNG/JPEG re-encodes
+            of the same picture share an entry)
+        params: Dict of settings that affect Tesseract's raw output
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(json.dumps(
+        {'format': CACHE_FORMAT, 'mode': image.mode, 'size': image.size, **params},
+        sort_keys=True,
+    ).encode("utf-8"))
+    palette = image.getpalette() if image.mode == "P" else None
+    if palette:
+        h.update(bytes(palette))
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def _path(key):
+    return os.path.join(CACHE_DIR, key + ".json")
+
+
+def get(key):
+    """Return cached data for key, or None on a miss."""
+    global _hits, _misses
+    path = _path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        os.utime(path)
+    except (OSError, ValueError):
+        with _lock:
+            _misses += 1
+        return None
+
+    with _lock:
+        _hits += 1
+    return data
+
+
+def put(key, data, max_bytes):
+    """Store data under key, then evict old entries beyond max_bytes."""
+    global _total_bytes
+    if max_bytes <= 0:
+        return
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    payload = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    path = _path(key)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+
+    with open(tmp, "wb") as f:
+        f.write(payload)
+    os.replace(tmp, path)
+
+    with _lock:
+        if _total_bytes is None:
+            _total_bytes = _scan_size()
+        else:
+            _total_bytes += len(payload)
+        if _total_bytes > max_bytes:
+            _evict(max_bytes)
+
+
+def _entries():
+    """List (mtime, size, path) for every cache entry."""
+    entries = []
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return entries
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+
+def _scan_size():
+    return sum(size for _, size, _ in _entries())
+
+
+def _evict(max_bytes):
+    """Delete least recently used entries until below 90% of max_bytes."""
+    global _total_bytes
+    entries = sorted(_entries())
+    total = sum(size for _, size, _ in entries)
+    target = max_bytes * 0.9
+
+    for _, size, path in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+    _total_bytes = total
+
+
+def clear():
+    """Remove every cache entry and reset the counters."""
+    global _total_bytes, _hits, _misses
+    with _lock:
+        for _, _, path in _entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        _total_bytes = 0
+        _hits = 0
+        _misses = 0
+
+
+def stats():
+    """Return hit/miss counters and current on-disk size."""
+    with _lock:
+        size = _total_bytes if _total_bytes is not None else _scan_size()
+        return {'hits': _hits, 'misses': _misses, 'bytes': size}
@@ -0,0 +1,194 @@
+"""
+OCR Data Module
+Compact columnar containers for the OCR pipeline
+
+Architecture:
+- WordTable: one typed array per TSV column, holding only usable words
+  (non-empty text, confidence >= 0). Text is reduced to its length, which is
+  all the filters need.
+- LineTable: per-line accumulators (bbox, confidence sum, word count, text
+  length) built in a single group-by pass over a WordTable
+- RegionArray: left/top/width/height arrays carried through filtering,
+  merging and collision checks; converted to dicts only for JSON
+"""
+
+from array import array
+
+TSV_FIELDS = 12  # level, page, block, par, line, word, left, top, width, height, conf, text
+
+
+class WordTable:
+    """Word boxes from Tesseract as parallel int arrays."""
+
+    COLUMNS = ('block', 'par', 'line', 'left', 'top', 'width', 'height', 'conf', 'text_len')
+    __slots__ = COLUMNS + ('seams',)
+
+    def __init__(self):
+        for name in self.COLUMNS:
+            setattr(self, name, array('i'))
+        # Vertical tile seam positions (see tiling.stitch_seams)
+        self.seams = []
+
+    def __len__(self):
+        return len(self.block)
+
+    def append(self, block, par, line, left, top, width, height, conf, text_len):
+        self.block.append(block)
+        self.par.append(par)
+        self.line.append(line)
+        self.left.append(left)
+        self.top.append(top)
+        self.width.append(width)
+        self.height.append(height)
+        self.conf.append(conf)
+        self.text_len.append(text_len)
+
+    def rows(self):
+        """Iterate rows as tuples in COLUMNS order."""
+        return zip(*(getattr(self, name) for name in self.COLUMNS))
+
+    def to_json(self):
+        data = {name: getattr(self, name).tolist() for name in self.COLUMNS}
+        data['seams'] = list(self.seams)
+        return data
+
+    @classmethod
+    def from_json(cls, data):
+        table = cls()
+        for name in cls.COLUMNS:
+            getattr(table, name).extend(data[name])
+        table.seams = list(data.get('seams', ()))
+        return table
+
+
+def parse_tsv(tsv):
+    """
+    Parse Tesseract TSV output into a WordTable.
+
+    Header, non-word and empty rows are skipped, as are words with negative
+    confidence. Confidence is truncated to int.
+    """
+    table = WordTable()
+    append = table.append
+    for row in tsv.splitlines():
+        cells = row.split('\t', TSV_FIELDS - 1)
+        if len(cells) < TSV_FIELDS:
+            continue
+        text = cells[11].strip()
+        if not text:
+            continue
+        try:
+            conf = int(float(cells[10]))
+            if conf < 0:
+                continue
+            append(int(cells[2]), int(cells[3]), int(cells[4]),
+                   int(cells[6]), int(cells[7]), int(cells[8]), int(cells[9]),
+                   conf, len(text))
+        except ValueError:
+            # Header row or malformed line
+            continue
+    return table
+
+
+class LineTable:
+    """Per-line aggregates of a WordTable, indexed by first appearance."""
+
+    __slots__ = ('keys', 'left', 'top', 'right', 'bottom', 'conf_sum', 'words', 'text_len')
+
+    def __init__(self):
+        self.keys = []
+        for name in self.__slots__[1:]:
+            setattr(self, name, array('i'))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def absorb(self, a, b):
+        """Merge line b into line a; b is left with zero words (dropped later)."""
+        self.left[a] = min(self.left[a], self.left[b])
+        self.top[a] = min(self.top[a], self.top[b])
+        self.right[a] = max(self.right[a], self.right[b])
+        self.bottom[a] = max(self.bottom[a], self.bottom[b])
+        self.conf_sum[a] += self.conf_sum[b]
+        self.words[a] += self.words[b]
+        # Joined with a space, like ' '.join(texts)
+        self.text_len[a] += self.text_len[b] + 1
+        self.words[b] = 0
+
+
+def group_lines(words):
+    """Group a WordTable by (block, paragraph, line) in one pass."""
+    lines = LineTable()
+    index = {}
+    keys, left, top, right, bottom = lines.keys, lines.left, lines.top, lines.right, lines.bottom
+    conf_sum, count, text_len = lines.conf_sum, lines.words, lines.text_len
+
+    for block, par, line, l, t, w, h, conf, n in words.rows():
+        key = (block, par, line)
+        k = index.get(key)
+        if k is None:
+            index[key] = len(keys)
+            keys.append(key)
+            left.append(l)
+            top.append(t)
+            right.append(l + w)
+            bottom.append(t + h)
+            conf_sum.append(conf)
+            count.append(1)
+            text_len.append(n)
+            continue
+
+        if l < left[k]:
+            left[k] = l
+        if t < top[k]:
+            top[k] = t
+        if l + w > right[k]:
+            right[k] = l + w
+        if t + h > bottom[k]:
+            bottom[k] = t + h
+        conf_sum[k] += conf
+        count[k] += 1
+        text_len[k] += n + 1
+
+    return lines
+
+
+class RegionArray:
+    """Compact list of (left, top, width, height) boxes."""
+
+    __slots__ = ('left', 'top', 'width', 'height')
+
+    def __init__(self):
+        self.left = array('i')
+        self.top = array('i')
+        self.width = array('i')
+        self.height = array('i')
+
+    def __len__(self):
+        return len(self.left)
+
+    def __iter__(self):
+        return zip(self.left, self.top, self.width, self.height)
+
+    def __getitem__(self, i):
+        return self.left[i], self.top[i], self.width[i], self.height[i]
+
+    def append(self, left, top, width, height):
+        self.left.append(left)
+        self.top.append(top)
+        self.width.append(width)
+        self.height.append(height)
+
+    def to_dicts(self):
+        """Region dicts for JSON serialization."""
+        return [
+            {'left': l, 'top': t, 'width': w, 'height': h}
+            for l, t, w, h in self
+        ]
+
+    @classmethod
+    def from_dicts(cls, regions):
+        result = cls()
+        for r in regions:
+            result.append(r['left'], r['top'], r['width'], r['height'])
+        return result
@@ -1,27 +1,176 @@
 """
 OCR Engine Module
-Handles all OCR processing using pytesseract with line-based detection
+Handles all OCR processing with line-based detection.
+Recognition runs in-process through libtesseract when available, otherwise
+through the tesseract binary (run by us so a cancelled job can kill it; the
+image goes in over stdin and TSV comes back over stdout, no temp files).
+
+Detection backends (config "detector") produce line boxes; merging and
+collision filtering are shared:
+- "tesseract": PSM 12 recognition, word -> line grouping, confidence and
+  text-length filters (accurate, slower)
+- "fast": fast_detector, text-like connected components without recognition
+
+Either backend can run on crops of the image instead (coverage.py plans
+them for re-detection); crop results are mapped back to image pixels. With
+an on_batch callback, boxes are streamed as crops (or horizontal bands of
+the full image) finish, see streaming.py. A full-image pass that is tiled
+anyway streams its tiles instead, so they keep running in parallel.
+
+Everything that only depends on the config (binary path, backend, installed
+languages, engine version) lives in an EngineSession that is built once,
+warmed up in the background at profile load, and rebuilt on config change.
 """
 
+import copy
+import io
 import os
 import platform
+import subprocess
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+
 from aqt import mw
 
+from . import fast_detector
+from . import language_select
+from . import ocr_cache
+from . import preprocess
+from . import streaming
+from . import tesseract_capi
+from . import tiling
+from . import tracing
+from .ocr_data import RegionArray, WordTable, group_lines, parse_tsv
+from .ocr_jobs import (
+    JobCancelled, check_cancelled, current_token, map_parallel, submit_background, track_process,
+)
 
-def _setup_tesseract(config):
-    """Configure pytesseract to find the tesseract binary."""
-    import pytesseract
+PSM = 12
+
+# Lines with at least this much text always pass the text length filter,
+# whatever the average line length is
+MIN_TEXT_LEN_CAP = 3
+
+# (backend, tesseract_cmd) -> version string; probing may spawn a process
+_engine_versions = {}
+_capi_warned = False
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class EngineSession:
+    """
+    Tesseract setup for the current config, resolved once and reused.
+
+    Building a session does all the probing (binary path, libtesseract,
+    installed languages); requests only read its fields. It is replaced
+    when the config changes.
+    """
+
+    def __init__(self, config):
+        import pytesseract
+
+        self.config = config
+        self.cmd = _find_tesseract(config)
+        pytesseract.pytesseract.tesseract_cmd = self.cmd
+        self.backend = 'libtesseract' if _use_capi(config, self.cmd) else 'cli'
+        self.installed_langs = _list_langs(self.cmd)
+        self.lang, self.missing_langs = _validate_langs(
+            config.get('tesseract_lang') or 'eng', self.installed_langs
+        )
+        self._version = None
+
+    @property
+    def version(self):
+        """Engine version string (part of the OCR cache key)."""
+        if self._version is None:
+            self._version = _engine_version(self.backend, self.cmd)
+        return self._version
+
+    def with_lang(self, lang):
+        """A copy of the session that recognizes with another language string."""
+        if lang == self.lang:
+            return self
+        session = copy.copy(self)
+        session.lang = lang
+        return session
+
+    def warm_up(self):
+        """Recognize a tiny image so the language model is loaded before the first request."""
+        from PIL import Image, ImageDraw
+
+        if self.config.get('detector', 'tesseract') != 'tesseract':
+            return
+
+        image = Image.new("L", (96, 32), 255)
+        ImageDraw.Draw(image).rectangle((8, 10, 88, 20), fill=0)
+        _run_tesseract(image, self)
+
+
+def get_session():
+    """Return the current EngineSession, building it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            config = mw.addonManager.getConfig(__name__) or {}
+            _session = EngineSession(config)
+            if _session.missing_langs:
+                print(f"[Auto Image Occlusion] Tesseract language(s) not installed: "
+                      f"{', '.join(_session.missing_langs)}; using '{_session.lang}'")
+        return _session
+
+
+def invalidate_session():
+    """Drop the session; the next request (or warm_up) builds a new one."""
+    global _session
+    with _session_lock:
+        _session = None
+
+
+def warm_up():
+    """Build the session and load the models on the background worker."""
+    def task():
+        try:
+            import pytesseract  # noqa: F401
+        except ImportError:
+            return
+        try:
+            session = get_session()
+            session.version
+            session.warm_up()
+        except Exception as e:
+            print(f"[Auto Image Occlusion] Tesseract warm-up failed: {e}")
+            return
+        if session.missing_langs:
+            mw.taskman.run_on_main(lambda: _warn_missing_langs(session))
+
+    submit_background(task)
+
+
+def _warn_missing_langs(session):
+    from aqt.utils import tooltip
+
+    tooltip(
+        f"Auto Image Occlusion: Tesseract language(s) "
+        f"{', '.join(session.missing_langs)} not installed, using '{session.lang}'",
+        period=6000,
+    )
+
+
+def _find_tesseract(config):
+    """Return the tesseract binary to run: configured, on PATH, or a common install path."""
+    from shutil import which
 
     # User-configured path takes priority
     cmd = config.get("tesseract_cmd", "")
     if cmd:
-        pytesseract.pytesseract.tesseract_cmd = cmd
-        return
+        return which(cmd) or cmd
 
-    # If pytesseract can already find it, nothing to do
-    from shutil import which
-    if which("tesseract"):
-        return
+    found = which("tesseract")
+    if found:
+        return found
 
     # Fallback: check common install paths per platform
     system = platform.system()
@@ -37,105 +186,500 @@ def _setup_tesseract(config):
 
     for path in candidates:
         if os.path.isfile(path):
-            pytesseract.pytesseract.tesseract_cmd = path
-            return
+            return path
+    return "tesseract"
+
+
+def _popen_kwargs():
+    """Keep Windows from flashing a console window for each tesseract run."""
+    if platform.system() == "Windows":
+        return {"creationflags": subprocess.CREATE_NO_WINDOW}
+    return {}
 
 
-def perform_ocr(image):
-    """Run pytesseract OCR on an image and return bounding boxes."""
+def _list_langs(cmd):
+    """Languages the binary reports via --list-langs, or None if it can't be asked."""
+    try:
+        result = subprocess.run(
+            [cmd, "--list-langs"], stdin=subprocess.DEVNULL, capture_output=True,
+            timeout=10, **_popen_kwargs(),
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode:
+        return None
+    # First line is 'List of available languages in "<dir>" (N):'
+    lines = result.stdout.decode("utf-8", errors="replace").splitlines()[1:]
+    return frozenset(line.strip() for line in lines if line.strip())
+
+
+def _validate_langs(requested, installed):
+    """
+    Drop languages that aren't installed.
+
+    Returns:
+        (language string to use, list of missing languages)
+    """
+    wanted = [lang for lang in requested.split('+') if lang]
+    if installed is None:
+        return requested, []
+
+    available = [lang for lang in wanted if lang in installed]
+    missing = [lang for lang in wanted if lang not in installed]
+    if not missing:
+        return requested, []
+    if not available:
+        if 'eng' in installed:
+            available = ['eng']
+        else:
+            available = sorted(installed - {'osd'})[:1] or wanted
+    return '+'.join(available), missing
+
+
+def _use_capi(config, cmd):
+    """Decide whether to run libtesseract in-process."""
+    global _capi_warned
+    backend = config.get('tesseract_backend', 'auto')
+    if backend == 'cli':
+        return False
+
+    if tesseract_capi.available(cmd):
+        return True
+
+    if backend == 'libtesseract' and not _capi_warned:
+        _capi_warned = True
+        print("[Auto Image Occlusion] libtesseract not found, falling back to the tesseract binary")
+    return False
+
+
+def _engine_version(backend, cmd):
+    """Return the Tesseract version for a backend (memoized)."""
+    import pytesseract
+
+    key = (backend, cmd)
+    if key not in _engine_versions:
+        if backend == 'libtesseract':
+            _engine_versions[key] = tesseract_capi.version(cmd)
+        else:
+            _engine_versions[key] = str(pytesseract.get_tesseract_version())
+    return _engine_versions[key]
+
+
+def perform_ocr(image, crops=None, on_batch=None, language_scope=None):
+    """
+    Run Tesseract OCR on an image and return a RegionArray of line boxes.
+
+    Args:
+        crops: Optional tiling.Tile(box, core) list; only the crops are
+            OCR'd and a box is kept by the crop whose core holds its centre
+        on_batch: Optional callback receiving the final boxes in batches
+            while OCR is still running (called on worker threads). Every
+            streamed box is also in the result.
+        language_scope: Key for the remembered language choice (see
+            language_select) when config "auto_lang" is on
+    """
     try:
         import pytesseract
     except ImportError:
-        return []
+        return RegionArray()
 
     try:
-        config = mw.addonManager.getConfig(__name__) or {}
-        _setup_tesseract(config)
-        return _detect_lines(image, config)
+        with tracing.span("setup"):
+            session = get_session()
+        config = session.config
+        if config.get('auto_lang', False) and config.get('detector', 'tesseract') == 'tesseract':
+            session = session.with_lang(
+                language_select.choose(image, session, language_scope, _run_tesseract)
+            )
+            tracing.note(lang=session.lang)
+        return _detect_lines(image, session, crops, on_batch)
+    except JobCancelled:
+        raise
     except Exception:
         import traceback
         traceback.print_exc()
-        return []
+        return RegionArray()
+
+
+def _detect_lines(image, session, crops=None, on_batch=None):
+    """Detect text lines with the configured backend, then merge."""
+    config = session.config
+    name = config.get('detector', 'tesseract')
+    detector = DETECTORS.get(name)
+    if detector is None:
+        print(f"[Auto Image Occlusion] Unknown detector '{name}', using tesseract")
+        name, detector = 'tesseract', _tesseract_lines
+
+    factor = config.get('vertical_merge_factor', 0.65)
+    stream = None
+    tile_stream = None
+    if on_batch is not None:
+        # The fast detector finishes in well under a second; splitting it
+        # into bands only adds work
+        if crops is None and name == 'tesseract':
+            crops = _stream_bands(image.size, config)
+            if crops is None:
+                tile_stream = _TileStream(image.size, config, factor, on_batch)
+        if crops and len(crops) > 1:
+            stream = streaming.RegionStream(crops, _merge_vertically_close, factor, on_batch)
+
+    if tile_stream is not None:
+        regions = _tesseract_lines(image, session, tile_stream=tile_stream)
+        stream = tile_stream.stream
+    elif crops is None:
+        regions = detector(image, session)
+    else:
+        with tracing.span("crops"):
+            regions = _detect_in_crops(image, session, detector, crops, stream)
+        tracing.note(crops=len(crops))
+    with tracing.span("merge"):
+        merged = _merge_vertically_close(regions, factor)
+
+    if stream is not None:
+        stream.finish(merged, regions)
+        tracing.note(batches=stream.batches)
+    elif on_batch is not None and merged:
+        on_batch(merged)
+
+    tracing.note(detector=name, regions_filtered=len(regions), regions_merged=len(merged))
+    return merged
 
 
-def _detect_lines(image, config):
-    """Detect text lines via PSM 12, filter by confidence/size, then merge."""
-    import pytesseract
+def _stream_bands(size, config):
+    """
+    Horizontal bands for a streamed full-image pass, or None if it fits in
+    one or is wide enough to be tiled anyway. Bands run on the tile pool, so
+    tiles inside them would run inline; wide images stream by tile instead
+    (_TileStream).
+    """
+    band_size = config.get('tile_size', 2048)
+    width, height = size
+    if not band_size or height <= band_size * 1.25 or width > band_size * 1.25:
+        return None
+    return tiling.plan_bands(width, height, band_size, config.get('tile_overlap', 128))
+
+
+class _TileStream:
+    """
+    Streams a full-image pass by the tiles _recognize_tiled runs anyway.
+
+    Each finished tile's lines go to a streaming.RegionStream, minus the
+    ones the whole-image steps could still change: lines near a vertical
+    seam wait for stitching, and the text length filter uses its strictest
+    threshold. So streaming doesn't change the result.
+    """
+
+    def __init__(self, size, config, factor, on_batch):
+        """size is the original image's; tiles arrive in preprocessed pixels."""
+        self._size = size
+        self._config = config
+        self._factor = factor
+        self._on_batch = on_batch
+        self._lock = threading.Lock()
+        self._seams = ()
+        self.stream = None
+
+    def add(self, tiles, index, words, scale):
+        """Stream tile index's words (a WordTable, None if blank); scale as from prepare."""
+        with self._lock:
+            if self.stream is None:
+                self._seams = [round(x / scale) for x in tiling.vertical_seams(tiles)]
+                crops = [
+                    tiling.Tile(box=_unscale(tile.box, scale), core=_unscale(tile.core, scale))
+                    for tile in tiles
+                ]
+                self.stream = streaming.RegionStream(
+                    crops, _merge_vertically_close, self._factor, self._on_batch
+                )
+        self.stream.add(index, self._final_lines(tiles[index], words, scale))
+
+    def _final_lines(self, tile, words, scale):
+        if not words:
+            return RegionArray()
+        words = preprocess.scale_boxes(tiling.merge_tile_data([tile], [words]), scale)
+        lines = group_lines(words)
+        for k in range(len(lines)):
+            box = lines.left[k], lines.top[k], lines.right[k], lines.bottom[k]
+            if tiling.near_seam(box, self._seams):
+                # Dropped like a line absorbed by stitching
+                lines.words[k] = 0
+        return _filter_lines(lines, self._size, self._config, MIN_TEXT_LEN_CAP)
+
+
+def _unscale(box, scale):
+    return tuple(round(v / scale) for v in box)
+
+
+def _tesseract_lines(image, session, text_height=None, tile_stream=None):
+    """Line boxes via PSM 12, filtered by confidence/size/text length."""
+    words = _image_to_data(image, session, text_height, tile_stream)
+
+    with tracing.span("group"):
+        lines = group_lines(words)
+        lines = tiling.stitch_seams(lines, words.seams)
+    with tracing.span("filter"):
+        regions = _filter_lines(lines, image.size, session.config)
+
+    tracing.note(words=len(words), lines=len(lines))
+    return regions
 
-    data = pytesseract.image_to_data(
-        image,
-        output_type=pytesseract.Output.DICT,
-        lang=config.get('tesseract_lang', 'eng'),
-        config='--psm 12',
-    )
 
-    lines = _group_words_into_lines(data)
-    lines = _filter_lines(lines, image.size, config)
-    regions = _lines_to_regions(lines)
-    regions = _merge_vertically_close(regions, config.get('vertical_merge_factor', 0.65))
+def _fast_lines(image, session, text_height=None):
+    """Line boxes from fast_detector (no recognition, not cached)."""
+    return fast_detector.detect_lines(image, session.config, text_height)
+
+
+# Detection backends: name -> fn(image, session, text_height=None) returning
+# line boxes as a RegionArray in image pixels. text_height is the full
+# image's estimate when image is a crop of it.
+DETECTORS = {
+    'tesseract': _tesseract_lines,
+    'fast': _fast_lines,
+}
+
+
+def _detect_in_crops(image, session, detector, crops, stream=None):
+    """
+    Run a detector on each crop (in parallel) and map its boxes to image pixels.
+
+    stream, a streaming.RegionStream, is fed each crop's boxes as it finishes.
+    """
+    if not crops:
+        return RegionArray()
+
+    # Decode once up front; crop threads only crop
+    image.load()
+
+    # Each crop's area threshold was relative to the crop; apply the
+    # image-wide one so results match a full pass
+    min_area = image.size[0] * image.size[1] * session.config.get('min_area_percent', 0.0001)
+
+    # Likewise the text height: a crop's own estimate rests on less text and
+    # would rescale unchanged text differently from a full pass
+    text_height = None
+    if detector is _fast_lines or session.config.get('preprocess', True):
+        with tracing.span("estimate"):
+            text_height = preprocess.estimate_text_height(image)
+
+    def run_crop(index):
+        crop = crops[index]
+        region = image.crop(crop.box)
+        found = detector(region, session, text_height) if tiling.has_ink(region) else ()
+
+        offset_x, offset_y = crop.box[0], crop.box[1]
+        core_left, core_top, core_right, core_bottom = crop.core
+        kept = RegionArray()
+        for left, top, width, height in found:
+            left += offset_x
+            top += offset_y
+            cx = left + width / 2
+            cy = top + height / 2
+            if (core_left <= cx < core_right and core_top <= cy < core_bottom
+                    and width * height >= min_area):
+                kept.append(left, top, width, height)
+
+        if stream is not None:
+            stream.add(index, kept)
+        return kept
+
+    regions = RegionArray()
+    for kept in map_parallel(run_crop, range(len(crops))):
+        for region in kept:
+            regions.append(*region)
     return regions
 
 
-def _group_words_into_lines(data):
-    """Group OCR words by their (block, paragraph, line) key."""
-    lines = {}
-    for i in range(len(data['text'])):
-        text = data['text'][i].strip()
-        conf = int(data['conf'][i])
-        if not text or conf < 0:
-            continue
+def _image_to_data(image, session, text_height=None, tile_stream=None):
+    """Return Tesseract's words as a WordTable, served from the disk cache when possible."""
+    config = session.config
+    max_bytes = int(config.get('cache_max_mb', 50) * 1024 * 1024)
+
+    key = None
+    tracing.note(cache='off')
+    if max_bytes > 0:
+        with tracing.span("cache_lookup"):
+            params = {
+                'lang': session.lang,
+                'psm': PSM,
+                'backend': session.backend,
+                'engine': session.version,
+                'tile_size': config.get('tile_size', 2048),
+                'tile_overlap': config.get('tile_overlap', 128),
+                'preprocess': config.get('preprocess', True),
+                'preprocess_binarize': config.get('preprocess_binarize', False),
+                'target_text_height': config.get('target_text_height', 36),
+            }
+            if text_height is not None:
+                # Crops are scaled by the full image's estimate
+                params['text_height'] = text_height
+            key = ocr_cache.make_key(image, params)
+            data = ocr_cache.get(key)
+        if data is not None:
+            tracing.note(cache='hit')
+            return WordTable.from_json(data)
+        tracing.note(cache='miss')
+
+    words = _recognize(image, session, text_height, tile_stream)
+
+    if key is not None:
+        try:
+            ocr_cache.put(key, words.to_json(), max_bytes)
+        except OSError as e:
+            print(f"[Auto Image Occlusion] Failed to write OCR cache: {e}")
+
+    return words
+
+
+def _recognize(image, session, text_height=None, tile_stream=None):
+    """Preprocess, then OCR; word boxes come back in original pixels."""
+    with tracing.span("preprocess"):
+        prepared, scale = preprocess.prepare(image, session.config, text_height)
+    on_tile = None
+    if tile_stream is not None:
+        def on_tile(tiles, index, words):
+            tile_stream.add(tiles, index, words, scale)
+    with tracing.span("tesseract"):
+        words = _recognize_tiled(prepared, session, on_tile)
+    tracing.note(backend=session.backend, ocr_scale=round(scale, 3))
+    return preprocess.scale_boxes(words, scale)
+
+
+def _recognize_tiled(image, session, on_tile=None):
+    """
+    Run Tesseract on the whole image, or tile by tile in parallel if it's large.
+
+    on_tile(tiles, index, words) is called as each tile finishes (words is
+    None for a blank tile).
+    """
+    config = session.config
+    tile_size = config.get('tile_size', 2048)
+    width, height = image.size
+    if not tile_size or max(width, height) <= tile_size * 1.25:
+        return _run_tesseract(image, session)
+
+    # Decode once up front; tile threads only crop
+    image.load()
+    tiles = tiling.plan_tiles(width, height, tile_size, config.get('tile_overlap', 128))
+
+    def run_tile(index):
+        crop = image.crop(tiles[index].box)
+        words = _run_tesseract(crop, session) if tiling.has_ink(crop) else None
+        if on_tile is not None:
+            on_tile(tiles, index, words)
+        return words
+
+    return tiling.merge_tile_data(tiles, map_parallel(run_tile, range(len(tiles))))
+
+
+def _run_tesseract(image, session):
+    """Recognize to TSV with the in-process library (or the binary) and parse it."""
+    check_cancelled()
+
+    if session.backend == 'libtesseract':
+        token = current_token()
+        try:
+            tsv = tesseract_capi.image_to_tsv(
+                image, session.lang, PSM, session.cmd,
+                cancelled=(lambda: token.cancelled) if token else None,
+            )
+        except tesseract_capi.TesseractCAPIError as e:
+            check_cancelled()
+            print(f"[Auto Image Occlusion] libtesseract failed ({e}), using the tesseract binary")
+        else:
+            return parse_tsv(tsv)
+
+    return parse_tsv(_run_cli(image, session))
+
+
+def _run_cli(image, session):
+    """
+    Run the tesseract binary on image and return its TSV output.
+
+    Same command line pytesseract.image_to_data builds, but the image goes
+    in over stdin and the TSV comes back over stdout (no temp files), and
+    the process is registered with the current job so cancelling the job
+    kills it.
+    """
+    import pytesseract
+
+    data = _encode_for_pipe(image)
+    args = [
+        session.cmd, "stdin", "stdout",
+        "-l", session.lang, "--psm", str(PSM), "tsv",
+    ]
+    try:
+        proc = subprocess.Popen(
+            args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, **_popen_kwargs(),
+        )
+    except OSError:
+        raise pytesseract.TesseractNotFoundError()
+
+    with track_process(proc):
+        # communicate() ignores a broken stdin pipe (process killed or
+        # failed early); the return code tells what happened
+        out, err = proc.communicate(data)
+    check_cancelled()
+
+    if proc.returncode:
+        raise pytesseract.TesseractError(
+            proc.returncode, err.decode("utf-8", errors="replace").strip()
+        )
+    return out.decode("utf-8", errors="replace")
+
+
+def _encode_for_pipe(image):
+    """
+    Encode image for tesseract's stdin, favouring speed over size.
 
-        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
-        if key not in lines:
-            lines[key] = {'texts': [], 'confidences': [], 'boxes': []}
+    PNM is a header plus raw pixels. Leptonica on Windows reads PNM from
+    memory through a temp file, though, so there (and for images with
+    alpha) an uncompressed PNG is used instead.
+    """
+    if image.mode not in ("1", "L", "RGB", "RGBA"):
+        image = image.convert("RGB")
 
-        lines[key]['texts'].append(text)
-        lines[key]['confidences'].append(conf)
-        lines[key]['boxes'].append({
-            'left': data['left'][i],
-            'top': data['top'][i],
-            'width': data['width'][i],
-            'height': data['height'][i],
-        })
+    buffer = io.BytesIO()
+    if image.mode == "RGBA" or platform.system() == "Windows":
+        image.save(buffer, format="PNG", compress_level=0)
+    else:
+        image.save(buffer, format="PPM")
+    return buffer.getvalue()
 
-    return lines
 
+def _filter_lines(lines, img_size, config, min_text_len=None):
+    """
+    Keep lines that are large, confident and long enough; return their boxes.
 
-def _filter_lines(lines, img_size, config):
-    """Remove lines that are too small, low-confidence, or too short."""
+    min_text_len defaults to half the average line's text length, capped
+    at MIN_TEXT_LEN_CAP.
+    """
     img_w, img_h = img_size
     min_area = img_w * img_h * config.get('min_area_percent', 0.0001)
     min_conf = config.get('min_confidence', 48)
     min_w = config.get('min_width', 4)
     min_h = config.get('min_height', 4)
 
-    text_lengths = [len(' '.join(l['texts'])) for l in lines.values()]
-    avg_len = sum(text_lengths) / len(text_lengths) if text_lengths else 0
-    min_text_len = max(min(avg_len / 2, 3), 1)
+    # Lines absorbed by seam stitching have no words left
+    alive = [k for k, count in enumerate(lines.words) if count]
+    if min_text_len is None:
+        avg_len = sum(lines.text_len[k] for k in alive) / len(alive) if alive else 0
+        min_text_len = max(min(avg_len / 2, MIN_TEXT_LEN_CAP), 1)
 
-    filtered = {}
-    for key, line in lines.items():
-        boxes = line['boxes']
-        left = min(b['left'] for b in boxes)
-        top = min(b['top'] for b in boxes)
-        w = max(b['left'] + b['width'] for b in boxes) - left
-        h = max(b['top'] + b['height'] for b in boxes) - top
-        avg_conf = sum(line['confidences']) / len(line['confidences'])
-        text = ' '.join(line['texts'])
+    regions = RegionArray()
+    for k in alive:
+        left, top = lines.left[k], lines.top[k]
+        w = lines.right[k] - left
+        h = lines.bottom[k] - top
+        avg_conf = lines.conf_sum[k] / lines.words[k]
 
         if (avg_conf >= min_conf
-                and len(text.strip()) >= min_text_len
+                and lines.text_len[k] >= min_text_len
                 and w >= min_w and h >= min_h
                 and w * h >= min_area):
-            line['bbox'] = {'left': left, 'top': top, 'width': w, 'height': h}
-            filtered[key] = line
-
-    return filtered
+            regions.append(left, top, w, h)
 
-
-def _lines_to_regions(lines):
-    """Convert grouped lines to flat region dicts."""
-    return [line['bbox'] for line in lines.values()]
+    return regions
 
 
 def _merge_vertically_close(regions, factor):
@@ -143,10 +687,39 @@ def _merge_vertically_close(regions, factor):
     if len(regions) < 2:
         return regions
 
-    avg_h = sum(r['height'] for r in regions) / len(regions)
+    lefts, tops, widths, heights = regions.left, regions.top, regions.width, regions.height
+    merged = RegionArray()
+    for group in _merge_groups(regions, factor):
+        if len(group) == 1:
+            merged.append(*regions[group[0]])
+        else:
+            left = min(lefts[i] for i in group)
+            top = min(tops[i] for i in group)
+            merged.append(
+                left,
+                top,
+                max(lefts[i] + widths[i] for i in group) - left,
+                max(tops[i] + heights[i] for i in group) - top,
+            )
+
+    return merged
+
+
+def _merge_groups(regions, factor):
+    """
+    Union-find groups of _merge_vertically_close, as lists of region indexes
+    in output order.
+
+    regions only needs len() and left/top/width/height columns.
+    """
+    n = len(regions)
+    if not n:
+        return []
+    lefts, tops, widths, heights = regions.left, regions.top, regions.width, regions.height
+    avg_h = sum(heights) / n
     threshold = avg_h * factor
 
-    parent = list(range(len(regions)))
+    parent = list(range(n))
 
     def find(x):
         while parent[x] != x:
@@ -159,39 +732,55 @@ def _merge_vertically_close(regions, factor):
         if ra != rb:
             parent[ra] = rb
 
-    for i, r1 in enumerate(regions):
-        r1_right = r1['left'] + r1['width']
-        for j in range(i + 1, len(regions)):
-            r2 = regions[j]
-            gap = r2['top'] - (r1['top'] + r1['height'])
-            if gap < 0 or gap >= threshold:
+    # Sweep downwards by top edge. "active" holds regions whose bottom lies
+    # within threshold above the sweep line, ordered by left edge, so each
+    # region is only compared with close, horizontally nearby regions
+    # instead of every other one.
+    bottoms = [t + h for t, h in zip(tops, heights)]
+    by_top = sorted(range(n), key=tops.__getitem__)
+    by_bottom = sorted(range(n), key=bottoms.__getitem__)
+    # Every aligned pair has |left offset| below the wider width; +1 absorbs rounding
+    reach = max(widths) + 1
+
+    active = []        # (left, index), sorted
+    expiry = deque()   # active indices in bottom order
+    admitted = 0
+
+    for j in by_top:
+        top = tops[j]
+
+        # Admit regions ending at or above this top (gap >= 0) ...
+        while admitted < n and bottoms[by_bottom[admitted]] <= top:
+            i = by_bottom[admitted]
+            insort(active, (lefts[i], i))
+            expiry.append(i)
+            admitted += 1
+
+        # ... and retire those too far above (gap >= threshold)
+        while expiry and top - bottoms[expiry[0]] >= threshold:
+            i = expiry.popleft()
+            del active[bisect_left(active, (lefts[i], i))]
+
+        lo = bisect_left(active, (lefts[j] - reach, -1))
+        hi = bisect_right(active, (lefts[j] + reach, n))
+        r2_left, r2_width = lefts[j], widths[j]
+        r2_right = r2_left + r2_width
+
+        for _, i in active[lo:hi]:
+            # Pairs are only ever linked from the lower index to the higher,
+            # matching the original reading-order comparison
+            if i >= j:
                 continue
-
-            r2_right = r2['left'] + r2['width']
-            overlap_left = max(r1['left'], r2['left'])
-            overlap_right = min(r1_right, r2_right)
+            overlap_left = max(lefts[i], r2_left)
+            overlap_right = min(lefts[i] + widths[i], r2_right)
             overlap_w = max(0, overlap_right - overlap_left)
-            min_w = min(r1['width'], r2['width'])
-            offset = abs(r2['left'] - r1['left'])
+            min_w = min(widths[i], r2_width)
+            offset = abs(r2_left - lefts[i])
 
             if overlap_w > min_w * 0.3 or offset < min_w:
                 union(i, j)
 
     groups = {}
-    for i in range(len(regions)):
-        root = find(i)
-        groups.setdefault(root, []).append(regions[i])
-
-    merged = []
-    for group in groups.values():
-        if len(group) == 1:
-            merged.append(group[0])
-        else:
-            merged.append({
-                'left': min(r['left'] for r in group),
-                'top': min(r['top'] for r in group),
-                'width': max(r['left'] + r['width'] for r in group) - min(r['left'] for r in group),
-                'height': max(r['top'] + r['height'] for r in group) - min(r['top'] for r in group),
-            })
-
-    return merged
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
@@ -0,0 +1,233 @@
+"""
+OCR Job Runner Module
+Runs OCR work on a background thread pool and delivers results on the Qt main thread
+
+Architecture:
+- Worker pool: concurrent.futures.ThreadPoolExecutor (Tesseract runs out of
+  process or releases the GIL, so threads give real parallelism)
+- Delivery: completion callbacks are marshalled back with mw.taskman.run_on_main
+- Background pool: one worker at lowered OS priority for speculative work
+  (prefetch), so it never takes more than a core from real requests. Its
+  tiles and crops run inline rather than on the (normal priority) tile pool.
+- Cancellation: a CancelToken made current on the job's thread (and carried
+  into tile workers by map_parallel). Cancelling kills the tesseract
+  processes registered with it; library calls poll it through check();
+  the pipeline raises JobCancelled at the next stage boundary.
+- Lifetime: pool is created lazily on first use and shut down with the profile
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from aqt import mw
+
+_executor = None
+_tile_executor = None
+_background_executor = None
+
+# Niceness of the background worker (Linux only: set per thread, and
+# inherited by the tesseract processes it starts)
+BACKGROUND_NICENESS = 10
+
+_local = threading.local()
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once its CancelToken has been cancelled."""
+
+
+class CancelToken:
+    """Cancellation flag for one job, plus the processes to kill with it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._processes = set()
+        self.cancelled = False
+
+    def cancel(self):
+        """Flag the job and terminate its running tesseract processes."""
+        with self._lock:
+            self.cancelled = True
+            processes = list(self._processes)
+        for proc in processes:
+            _kill(proc)
+
+    def check(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+    @contextmanager
+    def process(self, proc):
+        """Kill proc if the job is cancelled while the block runs."""
+        with self._lock:
+            self._processes.add(proc)
+            cancelled = self.cancelled
+        if cancelled:
+            _kill(proc)
+        try:
+            yield proc
+        finally:
+            with self._lock:
+                self._processes.discard(proc)
+
+
+def _kill(proc):
+    try:
+        proc.kill()
+    except OSError:
+        pass
+
+
+@contextmanager
+def activate(token):
+    """Make token current on this thread for the duration of the block."""
+    previous = getattr(_local, 'token', None)
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+def current_token():
+    return getattr(_local, 'token', None)
+
+
+def check_cancelled():
+    """Raise JobCancelled if the current job has been cancelled."""
+    token = getattr(_local, 'token', None)
+    if token is not None:
+        token.check()
+
+
+@contextmanager
+def track_process(proc):
+    """Register a subprocess with the current job (no-op outside a job)."""
+    token = getattr(_local, 'token', None)
+    if token is None:
+        yield proc
+        return
+    with token.process(proc):
+        yield proc
+
+
+def _worker_count():
+    """Leave cores free for Anki itself; OCR jobs are long and CPU bound."""
+    return max(1, min(4, (os.cpu_count() or 2) // 2))
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=_worker_count(),
+            thread_name_prefix="AutoIO-OCR",
+        )
+    return _executor
+
+
+def submit(task, on_done):
+    """
+    Run task() on the worker pool.
+
+    Args:
+        task: Callable executed on a background thread
+        on_done: Called as on_done(future) on the main thread once task finishes
+
+    Returns:
+        concurrent.futures.Future for the submitted task
+    """
+    future = _get_executor().submit(task)
+
+    def deliver(fut):
+        mw.taskman.run_on_main(lambda: on_done(fut))
+
+    future.add_done_callback(deliver)
+    return future
+
+
+def run_many(fn, items):
+    """
+    Run fn over items on the job pool, yielding (item, future) as each finishes.
+
+    For callers that are already off the main thread and need progress
+    (e.g. Browser batch runs). Must not be called from a job worker.
+    """
+    pool = _get_executor()
+    futures = {pool.submit(fn, item): item for item in items}
+    for future in as_completed(futures):
+        yield futures[future], future
+
+
+def map_parallel(fn, items):
+    """
+    Run fn over items on the tile pool and return results in order.
+
+    Used from inside OCR jobs, so it has its own pool: sharing the job pool
+    could deadlock once every job worker is waiting on its own tiles. For
+    the same reason, calls made from a tile worker (tiles of a crop) run
+    inline. So do calls from the background worker, which must stay on its
+    one low-priority thread.
+    """
+    global _tile_executor
+    items = list(items)
+    inline = getattr(_local, 'tile_worker', False) or getattr(_local, 'background', False)
+    if len(items) < 2 or inline:
+        return [fn(item) for item in items]
+    if _tile_executor is None:
+        _tile_executor = ThreadPoolExecutor(
+            max_workers=os.cpu_count() or 2,
+            thread_name_prefix="AutoIO-Tile",
+        )
+
+    # Tile workers act on behalf of the calling job
+    token = current_token()
+
+    def run(item):
+        _local.tile_worker = True
+        with activate(token):
+            check_cancelled()
+            return fn(item)
+
+    return list(_tile_executor.map(run, items))
+
+
+def _lower_priority():
+    """Thread initializer for the background pool."""
+    _local.background = True
+    if sys.platform.startswith("linux"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), BACKGROUND_NICENESS)
+        except OSError:
+            pass
+
+
+def submit_background(task):
+    """
+    Run task() on the low-priority background worker.
+
+    Tasks run one at a time in submission order. There is no main-thread
+    callback; the caller keeps the future and reads or cancels it later.
+    """
+    global _background_executor
+    if _background_executor is None:
+        _background_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="AutoIO-Background",
+            initializer=_lower_priority,
+        )
+    return _background_executor.submit(task)
+
+
+def shutdown():
+    """Drop queued jobs and release the pools (running jobs finish on their own)."""
+    global _executor, _tile_executor, _background_executor
+    for pool in (_executor, _tile_executor, _background_executor):
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+    _tile_executor = None
+    _background_executor = None
@@ -0,0 +1,112 @@
+"""
+Prefetch Module
+Speculative OCR of the IO image as soon as the mask editor loads it
+
+Architecture:
+- Opt-in (config "prefetch"); started from the editor_mask_editor_did_load_image
+  hook, one prefetch per Editor (held weakly, like image_source)
+- Runs on ocr_jobs' background worker: a single thread at lowered priority,
+  so a prefetch never competes with a real request for more than one core
+- Result: the image's regions before collision filtering (the user can still
+  draw shapes before clicking), keyed by file path, mtime and image size
+- Reuse: a detection request for the same file takes a finished result
+  instead of starting OCR again. One still running is cancelled rather
+  than waited on: its single low-priority thread would be slower than the
+  request's own multi-core run
+- Staleness: loading another note or image into the editor cancels the
+  previous prefetch, killing its tesseract process if it already started
+"""
+
+import os
+import weakref
+from collections import namedtuple
+
+from aqt import mw
+
+from . import image_source, language_select
+from .dependency_manager import is_ready as dependencies_installed
+from .ocr_engine import perform_ocr
+from .ocr_jobs import CancelToken, activate, submit_background
+
+Prefetch = namedtuple("Prefetch", ["source", "path", "mtime", "future", "token"])
+
+_prefetches = weakref.WeakKeyDictionary()
+
+
+def start(editor, path_or_nid):
+    """Queue a background OCR of the editor's current image (if enabled)."""
+    cancel(editor)
+
+    config = mw.addonManager.getConfig(__name__) or {}
+    if not config.get('prefetch', False) or not dependencies_installed():
+        return
+
+    path = image_source.resolve_path(editor)
+    if not path:
+        return
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return
+
+    # Same scope as the request would use, so auto_lang's choice carries over
+    scope = language_select.scope_for_editor(editor)
+    token = CancelToken()
+    future = submit_background(lambda: _detect(path, token, scope))
+    _prefetches[editor] = Prefetch(path_or_nid, path, mtime, future, token)
+
+
+def _detect(path, token, scope):
+    """Return (image size, regions) for the file. Runs on the background worker."""
+    with activate(token):
+        token.check()
+        image = image_source.open_image(path)
+        return image.size, perform_ocr(image, language_scope=scope)
+
+
+def cancel(editor):
+    """Forget the editor's prefetch and cancel it."""
+    try:
+        entry = _prefetches.pop(editor, None)
+    except TypeError:
+        return
+    if entry is not None:
+        entry.token.cancel()
+        entry.future.cancel()
+
+
+def lookup(editor, path):
+    """
+    Return the editor's finished prefetch future for path, else None.
+
+    An unfinished prefetch is cancelled. The future resolves to (image size,
+    RegionArray); callers must check the size against what the editor shows
+    and fall back to OCR on any error.
+    """
+    try:
+        entry = _prefetches.get(editor)
+    except TypeError:
+        return None
+    if entry is None or entry.path != path or entry.token.cancelled:
+        return None
+    try:
+        if os.path.getmtime(path) != entry.mtime:
+            return None
+    except OSError:
+        return None
+    if not entry.future.done():
+        cancel(editor)
+        return None
+    return entry.future
+
+
+def on_editor_did_load_note(editor):
+    """Hook: a different note makes the editor's prefetch stale."""
+    entry = _prefetches.get(editor)
+    if entry is None:
+        return
+    # Existing IO notes load the note first and the image right after;
+    # keep the prefetch if it is for this very note
+    note = editor.note
+    if isinstance(entry.source, str) or note is None or note.id != entry.source:
+        cancel(editor)
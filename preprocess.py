@@ -0,0 +1,206 @@
+"""
+Preprocessing Module
+Prepares images for Tesseract: grayscale, optional adaptive binarization and
+rescaling so text lands at the height Tesseract recognizes fastest and best
+
+Architecture:
+- Text height: letters are smeared into word blocks on a reduced copy, thin
+  strokes (diagram lines) are opened away, and the median block height down
+  narrow columns is the estimate (Pillow resize/filter calls only, no
+  per-pixel Python). Crops reuse their full image's estimate.
+- Rescale: only when the estimate is well outside the target, in either
+  direction, clamped to sane factors and a pixel budget
+- Mapping: recognize() callers divide word boxes by the returned scale
+  (scale_boxes) so everything downstream sees original pixels
+"""
+
+import math
+import re
+from array import array
+
+# Max side of the reduced copy used for text height estimation
+ESTIMATE_SIZE = 1536
+
+# Horizontal smear that joins letters into word blocks (original pixels)
+SMEAR_PX = 16
+
+# Smear cells per column when measuring block heights (8 cells = 128 px)
+STRIP_CELLS = 8
+
+# Dilations that grow opened word blocks back to their full height
+REGROW_STEPS = 6
+
+# Fewer line samples than this is too little to go on
+MIN_BANDS = 3
+
+_INK_RUN_RE = re.compile(rb"\x00+")
+
+# Local contrast (gray levels) that counts as ink when binarizing
+BINARIZE_CONTRAST = 12
+
+MIN_SCALE = 0.25
+MAX_SCALE = 2.5
+MAX_PIXELS = 16_000_000
+
+
+def to_grayscale(image):
+    """Flatten transparency onto white and convert to 8-bit grayscale."""
+    from PIL import Image
+
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, rgba)
+    return image.convert("L")
+
+
+def binarize(gray, radius):
+    """
+    Adaptive threshold against the local mean: black ink on white paper.
+
+    Pixels darker than their neighbourhood by more than BINARIZE_CONTRAST
+    become ink. Mostly dark images are inverted first, so light-on-dark
+    text also comes out black on white.
+    """
+    from PIL import ImageChops, ImageFilter, ImageOps, ImageStat
+
+    if ImageStat.Stat(gray).mean[0] < 128:
+        gray = ImageOps.invert(gray)
+    local = gray.filter(ImageFilter.BoxBlur(max(1, int(radius))))
+    darker = ImageChops.subtract(local, gray)
+    return darker.point(lambda v: 0 if v > BINARIZE_CONTRAST else 255)
+
+
+def estimate_text_height(image):
+    """
+    Estimate the typical text line height in pixels, or None if fewer than
+    MIN_BANDS text-like bands were found.
+
+    Works on a reduced copy, but every size that matters (smear, strips,
+    binarization radius) is fixed in original pixels or relative to the
+    reduced copy, so a crop of an image gets the same estimate as the whole.
+    """
+    from PIL import Image, ImageChops
+
+    if image.mode not in ("L", "RGB", "RGBA"):
+        image = to_grayscale(image)
+    width, height = image.size
+    factor = max(1, math.ceil(max(width, height) / ESTIMATE_SIZE))
+    small = to_grayscale(image.reduce(factor) if factor > 1 else image)
+    ink = binarize(small, max(8, max(small.size) // 64))
+
+    # Any ink in a SMEAR_PX wide cell keeps it ink: letters become solid blocks
+    smear = max(2, round(SMEAR_PX / factor))
+    if ink.width < smear * 3:
+        return None
+    ink = ink.reduce((smear, 1)).point(_any_ink)
+
+    # Opening (erode, then dilate ink) drops strokes under three cells thick:
+    # diagram lines, arrows, frames. Growing the survivors back inside the
+    # smeared ink restores ascenders and descenders the opening trimmed.
+    blocks = _grow_ink(_shrink_ink(ink))
+    for _ in range(REGROW_STEPS):
+        grown = ImageChops.lighter(_grow_ink(blocks), ink)
+        if ImageChops.difference(grown, blocks).getbbox() is None:
+            break
+        blocks = grown
+
+    # Columns of STRIP_CELLS cells: each ink run down a column is one line
+    # of the blocks it crosses
+    if blocks.width >= STRIP_CELLS * 2:
+        blocks = blocks.reduce((STRIP_CELLS, 1)).point(_any_ink)
+    columns = blocks.transpose(Image.Transpose.TRANSPOSE)
+    # A white column after each one so runs don't wrap into the next
+    padded = Image.new("L", (columns.width + 1, columns.height), 255)
+    padded.paste(columns, (0, 0))
+
+    max_band = small.height / 4
+    bands = sorted(
+        length for length in map(len, _INK_RUN_RE.findall(padded.tobytes()))
+        if 3 <= length <= max_band
+    )
+    if len(bands) < MIN_BANDS:
+        return None
+    return bands[len(bands) // 2] * factor
+
+
+def _any_ink(value):
+    return 0 if value < 255 else 255
+
+
+def _all_ink(value):
+    return 0 if value == 0 else 255
+
+
+# 3x3 dilation/erosion of black ink. On a black/white image the box mean
+# says whether any or all of the neighbourhood is ink, and BoxBlur is far
+# cheaper than Min/MaxFilter's per-pixel sort.
+def _grow_ink(ink):
+    from PIL import ImageFilter
+
+    return ink.filter(ImageFilter.BoxBlur(1)).point(_any_ink)
+
+
+def _shrink_ink(ink):
+    from PIL import ImageFilter
+
+    return ink.filter(ImageFilter.BoxBlur(1)).point(_all_ink)
+
+
+def _choose_scale(text_height, image_size, target):
+    """Scale factor that brings text_height near target, or 1.0."""
+    if not text_height or not target:
+        return 1.0
+    if target / 1.5 <= text_height <= target * 1.5:
+        return 1.0
+
+    scale = max(MIN_SCALE, min(MAX_SCALE, target / text_height))
+    width, height = image_size
+    if scale > 1 and width * height * scale * scale > MAX_PIXELS:
+        scale = max(1.0, math.sqrt(MAX_PIXELS / (width * height)))
+    return scale
+
+
+def prepare(image, config, text_height=None):
+    """
+    Run the configured preprocessing steps.
+
+    Args:
+        text_height: Estimate made on the full image when image is a crop of
+            it; estimated here if None
+
+    Returns:
+        (prepared_image, scale) where scale is prepared / original size
+    """
+    from PIL import Image
+
+    if not config.get('preprocess', True):
+        return image, 1.0
+
+    gray = to_grayscale(image)
+    if text_height is None:
+        text_height = estimate_text_height(gray)
+    scale = _choose_scale(text_height, gray.size, config.get('target_text_height', 36))
+
+    if scale != 1.0:
+        size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+        resample = Image.Resampling.LANCZOS if scale > 1 else Image.Resampling.BOX
+        gray = gray.resize(size, resample)
+        if text_height:
+            text_height *= scale
+
+    if config.get('preprocess_binarize', False):
+        gray = binarize(gray, max(8, text_height or 16))
+
+    return gray, scale
+
+
+def scale_boxes(words, scale):
+    """Map a WordTable from preprocessed back to original pixel coordinates."""
+    if scale == 1.0:
+        return words
+    for name in ('left', 'top', 'width', 'height'):
+        column = getattr(words, name)
+        setattr(words, name, array('i', [round(v / scale) for v in column]))
+    words.seams = [round(x / scale) for x in words.seams]
+    return words
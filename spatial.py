@@ -0,0 +1,71 @@
+"""
+Spatial Index Module
+Uniform grid over axis-aligned boxes for fast intersection queries
+
+Architecture:
+- Boxes are (left, top, right, bottom) with closed edges, so touching boxes
+  intersect (an occlusion that merely touches a detection still counts)
+- Each box is registered in every grid cell it covers; a query only looks
+  at the cells its own box covers
+- Cell size defaults to the median box size, which keeps the number of
+  boxes per cell small for typical label layouts
+- Boxes can be added after construction (pass cell_size when starting empty)
+"""
+
+import math
+
+
+class GridIndex:
+    """Uniform grid of boxes supporting "which boxes touch this one?" queries."""
+
+    def __init__(self, boxes, cell_size=None):
+        """
+        Args:
+            boxes: Sequence of (left, top, right, bottom) tuples
+            cell_size: Grid cell edge length (defaults to the median box size)
+        """
+        self.boxes = list(boxes)
+        self.cells = {}
+
+        if cell_size is None:
+            sizes = sorted(max(b[2] - b[0], b[3] - b[1]) for b in self.boxes)
+            cell_size = sizes[len(sizes) // 2] if sizes else 1
+        self.cell_size = max(float(cell_size), 1.0)
+
+        for index, box in enumerate(self.boxes):
+            for key in self._cells_for(box):
+                self.cells.setdefault(key, []).append(index)
+
+    def add(self, box):
+        """Store one more box; returns its index."""
+        index = len(self.boxes)
+        self.boxes.append(box)
+        for key in self._cells_for(box):
+            self.cells.setdefault(key, []).append(index)
+        return index
+
+    def _cells_for(self, box):
+        size = self.cell_size
+        x0, x1 = math.floor(box[0] / size), math.floor(box[2] / size)
+        y0, y1 = math.floor(box[1] / size), math.floor(box[3] / size)
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                yield cx, cy
+
+    def query(self, box):
+        """Yield indices of stored boxes intersecting box (each index once)."""
+        left, top, right, bottom = box
+        seen = set()
+        for key in self._cells_for(box):
+            for index in self.cells.get(key, ()):
+                if index in seen:
+                    continue
+                seen.add(index)
+                other = self.boxes[index]
+                if not (bottom < other[1] or top > other[3]
+                        or right < other[0] or left > other[2]):
+                    yield index
+
+    def intersects_any(self, box):
+        """True if any stored box intersects box."""
+        return next(self.query(box), None) is not None
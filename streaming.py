@@ -0,0 +1,159 @@
+"""
+Streaming Module
+Hands out detected boxes in batches while the rest of the image is still
+being OCR'd
+
+Architecture:
+- Work units: crops (tiling.Tile) recognized in parallel. Full-image
+  Tesseract passes stream the tiles they are split into anyway, or use
+  horizontal bands (tiling.plan_bands) when the image is too narrow to be
+  tiled. A single crop is one batch at the end.
+- Settling: every finished crop adds its boxes, and everything received so
+  far is merged again. A merged box is final once it ends more than a merge
+  distance above the top of every unfinished crop's core. The distance uses
+  the tallest box so far rather than the average, since the average (and
+  so the final merge threshold) can still grow.
+- Batches: final boxes not handed out yet go to on_batch (from the worker
+  thread that finished the crop, under a lock so batches arrive in order).
+  finish() hands out the rest once every crop is done (from the final
+  merge, which may hold lines no crop handed in).
+- Boxes handed out are never taken back. A merged box that only repeats
+  them is skipped; one that grew past them (a late line merged into a box
+  already shown) is handed out as its new lines, merged among themselves,
+  so nothing is lost. Handed-out boxes are kept in a spatial.GridIndex.
+"""
+
+import threading
+
+from .ocr_data import RegionArray
+from .spatial import GridIndex
+
+# Grid cell size for the handed-out boxes (pixels)
+SENT_CELL_SIZE = 128
+
+
+class RegionStream:
+    """Collects per-crop boxes and passes on the ones that can't change any more."""
+
+    def __init__(self, crops, merge, factor, on_batch):
+        """
+        Args:
+            crops: The tiling.Tile crops being recognized
+            merge: fn(RegionArray, factor) -> merged RegionArray
+            factor: vertical_merge_factor
+            on_batch: Called with each RegionArray of final boxes
+        """
+        self._core_tops = [crop.core[1] for crop in crops]
+        self._pending = set(range(len(crops)))
+        self._merge = merge
+        self._factor = factor
+        self._on_batch = on_batch
+        self._lock = threading.Lock()
+        self._regions = RegionArray()
+        self._sent = GridIndex((), cell_size=SENT_CELL_SIZE)
+        self.batches = 0
+
+    def add(self, index, regions):
+        """Record crop index's boxes (image pixels) and pass on what has settled."""
+        with self._lock:
+            self._pending.discard(index)
+            for region in regions:
+                self._regions.append(*region)
+            if self._pending:
+                self._send(self._merge(self._regions, self._factor), self._settle_line())
+
+    def finish(self, merged, regions=None):
+        """
+        Pass on every box of the final merge that hasn't been handed out.
+
+        regions: The boxes merged (image pixels), if crops held some back
+        """
+        with self._lock:
+            self._pending.clear()
+            if regions is not None:
+                self._regions = regions
+            self._send(merged, None)
+
+    def _settle_line(self):
+        """y above which merged boxes are final."""
+        top = min(self._core_tops[i] for i in self._pending)
+        heights = self._regions.height
+        if not heights:
+            return top
+        # A box kept by an unfinished crop has its centre in the core, so
+        # it may start up to half its height above it
+        tallest = max(heights)
+        return top - tallest * (self._factor + 1.5)
+
+    def _send(self, merged, settle_line):
+        batch = RegionArray()
+        grown = []
+        for box in merged:
+            edges = _edges(box)
+            if settle_line is not None and edges[3] >= settle_line:
+                continue
+            sent = self._sent_overlapping(edges)
+            if any(_contains(edges, s) for s in sent):
+                grown.append(edges)
+            elif not any(_contains(s, edges) for s in sent):
+                self._add_sent(box, batch)
+
+        if grown:
+            # Their new lines, merged among themselves where that doesn't
+            # swallow a handed-out box again, otherwise one by one
+            blocked = []
+            for box in self._merge(self._unsent_within(grown), self._factor):
+                edges = _edges(box)
+                if any(_contains(edges, s) for s in self._sent_overlapping(edges)):
+                    blocked.append(edges)
+                else:
+                    self._add_sent(box, batch)
+            if blocked:
+                for region in self._unsent_within(blocked):
+                    self._add_sent(region, batch)
+
+        if batch:
+            self.batches += 1
+            self._on_batch(batch)
+
+    def _add_sent(self, box, batch):
+        self._sent.add(_edges(box))
+        batch.append(*box)
+
+    def _sent_overlapping(self, edges):
+        """Handed-out boxes overlapping edges; all (left, top, right, bottom)."""
+        left, top, right, bottom = edges
+        found = []
+        for index in self._sent.query(edges):
+            s_left, s_top, s_right, s_bottom = self._sent.boxes[index]
+            # The grid counts touching boxes; only a real overlap matters here
+            if left < s_right and s_left < right and top < s_bottom and s_top < bottom:
+                found.append(self._sent.boxes[index])
+        return found
+
+    def _unsent_within(self, boxes):
+        """
+        Received regions inside any of boxes (left, top, right, bottom) and
+        not inside a handed-out box.
+        """
+        index = GridIndex(boxes)
+        regions = RegionArray()
+        for region in self._regions:
+            edges = _edges(region)
+            if not any(_contains(index.boxes[i], edges) for i in index.query(edges)):
+                continue
+            if not any(_contains(s, edges) for s in self._sent_overlapping(edges)):
+                regions.append(*region)
+        return regions
+
+
+def _edges(box):
+    """(left, top, width, height) -> (left, top, right, bottom)."""
+    left, top, width, height = box
+    return left, top, left + width, top + height
+
+
+def _contains(outer, inner):
+    """True if inner lies within outer; both (left, top, right, bottom)."""
+    return (outer[0] <= inner[0] and outer[1] <= inner[1]
+            and inner[2] <= outer[2] and inner[3] <= outer[3])
@@ -0,0 +1,283 @@
+"""
+Tesseract C API Module
+In-process OCR through the system libtesseract, bound with ctypes
+
+Architecture:
+- Library: located once (next to the configured binary, then the usual
+  system names) and cached for the lifetime of the process
+- Handles: initialized TessBaseAPI objects are pooled per (datapath, language),
+  so the .traineddata model is loaded once instead of on every request
+- Thread safety: a handle is used by one thread at a time; concurrent
+  requests for the same language get their own handle from the pool
+- Output: raw TSV text, the same format the tesseract binary writes
+- Cancellation: when the library exports the progress monitor API,
+  recognition runs with a cancel callback that polls the caller's flag
+
+Anything that goes wrong here raises TesseractCAPIError and the caller falls
+back to the pytesseract subprocess path.
+"""
+
+import ctypes
+import ctypes.util
+import glob
+import os
+import platform
+import threading
+
+_lock = threading.Lock()
+_lib = None
+_lib_error = None
+_has_monitor = False
+_idle_handles = {}  # (datapath, lang) -> [handle, ...]
+
+
+class TesseractCAPIError(RuntimeError):
+    """Raised when libtesseract can't be loaded or used."""
+
+
+def _candidate_paths(tesseract_cmd):
+    """Yield library paths to try, most specific first."""
+    system = platform.system()
+
+    # Libraries shipped next to the binary (Windows installers, custom builds)
+    if tesseract_cmd and os.path.isabs(tesseract_cmd):
+        bin_dir = os.path.dirname(tesseract_cmd)
+        patterns = {
+            "Windows": ("libtesseract-*.dll", "tesseract*.dll"),
+            "Darwin": ("../lib/libtesseract*.dylib",),
+        }.get(system, ("../lib/libtesseract.so*",))
+        for pattern in patterns:
+            yield from sorted(glob.glob(os.path.join(bin_dir, pattern)), reverse=True)
+
+    found = ctypes.util.find_library("tesseract")
+    if found:
+        yield found
+
+    if system == "Darwin":
+        yield "/opt/homebrew/lib/libtesseract.dylib"
+        yield "/usr/local/lib/libtesseract.dylib"
+    elif system == "Windows":
+        for root in (r"C:\Program Files\Tesseract-OCR", r"C:\Program Files (x86)\Tesseract-OCR"):
+            yield from sorted(glob.glob(os.path.join(root, "libtesseract-*.dll")), reverse=True)
+    else:
+        yield "libtesseract.so.5"
+        yield "libtesseract.so.4"
+
+
+def _declare(lib):
+    """Attach argtypes/restype for the functions we call."""
+    p = ctypes.c_void_p
+    s = ctypes.c_char_p
+    i = ctypes.c_int
+    signatures = {
+        'TessVersion': ([], s),
+        'TessBaseAPICreate': ([], p),
+        'TessBaseAPIDelete': ([p], None),
+        'TessBaseAPIEnd': ([p], None),
+        'TessBaseAPIInit3': ([p, s, s], i),
+        'TessBaseAPISetPageSegMode': ([p, i], None),
+        'TessBaseAPISetImage': ([p, p, i, i, i, i], None),
+        'TessBaseAPIGetTSVText': ([p, i], p),
+        'TessBaseAPIClear': ([p], None),
+        'TessDeleteText': ([p], None),
+    }
+    for name, (argtypes, restype) in signatures.items():
+        fn = getattr(lib, name)
+        fn.argtypes = argtypes
+        fn.restype = restype
+
+
+# bool (*TessCancelFunc)(void* cancel_this, int words)
+_CANCEL_FUNC = ctypes.CFUNCTYPE(ctypes.c_bool, ctypes.c_void_p, ctypes.c_int)
+
+
+def _declare_monitor(lib):
+    """Attach the progress monitor functions; return False if the build lacks them."""
+    p = ctypes.c_void_p
+    signatures = {
+        'TessMonitorCreate': ([], p),
+        'TessMonitorDelete': ([p], None),
+        'TessMonitorSetCancelFunc': ([p, _CANCEL_FUNC], None),
+        'TessBaseAPIRecognize': ([p, p], ctypes.c_int),
+    }
+    try:
+        for name, (argtypes, restype) in signatures.items():
+            fn = getattr(lib, name)
+            fn.argtypes = argtypes
+            fn.restype = restype
+    except AttributeError:
+        return False
+    return True
+
+
+def _load(tesseract_cmd):
+    """Load libtesseract once; remember the failure so we don't retry every call."""
+    global _lib, _lib_error, _has_monitor
+    if _lib is not None or _lib_error is not None:
+        return _lib
+
+    errors = []
+    for path in _candidate_paths(tesseract_cmd):
+        try:
+            if platform.system() == "Windows" and os.path.isabs(path):
+                # Dependent DLLs (leptonica, etc.) live in the same folder
+                os.add_dll_directory(os.path.dirname(path))
+            lib = ctypes.CDLL(path)
+            _declare(lib)
+        except (OSError, AttributeError) as e:
+            errors.append(f"{path}: {e}")
+            continue
+        _lib = lib
+        _has_monitor = _declare_monitor(lib)
+        return _lib
+
+    _lib_error = "; ".join(errors) or "libtesseract not found"
+    return None
+
+
+def available(tesseract_cmd=""):
+    """Return True if libtesseract can be used in-process."""
+    with _lock:
+        return _load(tesseract_cmd) is not None
+
+
+def version(tesseract_cmd=""):
+    """Return the libtesseract version string."""
+    with _lock:
+        lib = _load(tesseract_cmd)
+    if lib is None:
+        raise TesseractCAPIError(_lib_error)
+    return lib.TessVersion().decode("utf-8", errors="replace")
+
+
+def _datapath(tesseract_cmd):
+    """tessdata folder next to the binary, or None for the compiled-in default."""
+    if os.environ.get("TESSDATA_PREFIX") or not tesseract_cmd:
+        return None
+    candidate = os.path.join(os.path.dirname(tesseract_cmd), "tessdata")
+    return candidate if os.path.isdir(candidate) else None
+
+
+def _acquire(lib, datapath, lang):
+    """Take an idle initialized handle for lang, or create one."""
+    key = (datapath, lang)
+    with _lock:
+        idle = _idle_handles.get(key)
+        if idle:
+            return idle.pop()
+
+    handle = lib.TessBaseAPICreate()
+    if not handle:
+        raise TesseractCAPIError("TessBaseAPICreate failed")
+
+    rc = lib.TessBaseAPIInit3(
+        handle,
+        datapath.encode("utf-8") if datapath else None,
+        lang.encode("utf-8"),
+    )
+    if rc != 0:
+        lib.TessBaseAPIDelete(handle)
+        raise TesseractCAPIError(f"Failed to load language '{lang}'")
+    return handle
+
+
+def _release(datapath, lang, handle):
+    with _lock:
+        _idle_handles.setdefault((datapath, lang), []).append(handle)
+
+
+def _image_buffer(image):
+    """Convert a PIL image to (bytes, bytes_per_pixel) in a mode Tesseract accepts."""
+    from PIL import Image
+
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        # Flatten transparency onto white; Leptonica would treat it as black
+        rgba = image.convert("RGBA")
+        background = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, rgba).convert("RGB")
+    elif image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+
+    return image.tobytes(), (1 if image.mode == "L" else 3), image
+
+
+def _recognize(lib, handle, cancelled):
+    """Run recognition with a monitor whose cancel callback polls cancelled()."""
+    monitor = lib.TessMonitorCreate()
+    if not monitor:
+        raise TesseractCAPIError("TessMonitorCreate failed")
+
+    # Keep a reference: ctypes frees the thunk when the object is collected
+    callback = _CANCEL_FUNC(lambda _this, _words: bool(cancelled()))
+    try:
+        lib.TessMonitorSetCancelFunc(monitor, callback)
+        rc = lib.TessBaseAPIRecognize(handle, monitor)
+    finally:
+        lib.TessMonitorDelete(monitor)
+
+    if cancelled():
+        raise TesseractCAPIError("Recognition cancelled")
+    if rc != 0:
+        raise TesseractCAPIError("Recognition failed")
+
+
+def image_to_tsv(image, lang, psm, tesseract_cmd="", cancelled=None):
+    """
+    Recognize an image in-process.
+
+    Args:
+        image: PIL Image
+        lang: Tesseract language string (e.g. "eng+fra")
+        psm: Page segmentation mode
+        tesseract_cmd: Configured binary path, used to locate the library
+            and tessdata on platforms that bundle them together
+        cancelled: Optional callable; once it returns True, recognition stops
+            early (if the library supports it) and TesseractCAPIError is raised
+
+    Returns:
+        TSV text (no header row)
+    """
+    with _lock:
+        lib = _load(tesseract_cmd)
+    if lib is None:
+        raise TesseractCAPIError(_lib_error)
+
+    buf, bpp, image = _image_buffer(image)
+    width, height = image.size
+    datapath = _datapath(tesseract_cmd)
+
+    handle = _acquire(lib, datapath, lang)
+    try:
+        lib.TessBaseAPISetPageSegMode(handle, psm)
+        lib.TessBaseAPISetImage(handle, buf, width, height, bpp, width * bpp)
+        if cancelled is not None and _has_monitor:
+            _recognize(lib, handle, cancelled)
+        # Recognizes first if _recognize didn't
+        ptr = lib.TessBaseAPIGetTSVText(handle, 0)
+        if not ptr:
+            raise TesseractCAPIError("Recognition failed")
+        try:
+            tsv = ctypes.string_at(ptr).decode("utf-8", errors="replace")
+        finally:
+            lib.TessDeleteText(ptr)
+        lib.TessBaseAPIClear(handle)
+    except Exception:
+        lib.TessBaseAPIEnd(handle)
+        lib.TessBaseAPIDelete(handle)
+        raise
+
+    _release(datapath, lang, handle)
+    return tsv
+
+
+def release_all():
+    """Free every pooled handle (their models stay loaded until then)."""
+    global _idle_handles
+    with _lock:
+        pools, _idle_handles = _idle_handles, {}
+    if _lib is None:
+        return
+    for handles in pools.values():
+        for handle in handles:
+            _lib.TessBaseAPIEnd(handle)
+            _lib.TessBaseAPIDelete(handle)
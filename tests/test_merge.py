@@ -0,0 +1,170 @@
+"""
+Equivalence of ocr_engine._merge_vertically_close with the original O(n^2)
+implementation it replaced, on seeded random regions.
+
+Runs under plain pytest; aqt is replaced by a stub like benchmarks/bench_ocr.py
+does, and only the pure-Python merge is exercised (no Tesseract or Pillow).
+"""
+
+import importlib
+import os
+import random
+import sys
+import types
+
+import pytest
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "auto_io_test"
+
+FACTORS = (0, 0.3, 0.65, 1.0, 2.0, 3.5)
+CASES = 200
+
+
+def _load_engine():
+    aqt = types.ModuleType("aqt")
+    aqt.mw = None
+    utils = types.ModuleType("aqt.utils")
+    utils.tooltip = lambda *args, **kwargs: None
+    utils.showWarning = lambda *args, **kwargs: None
+    aqt.utils = utils
+    sys.modules.setdefault("aqt", aqt)
+    sys.modules.setdefault("aqt.utils", utils)
+
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [ADDON_DIR]
+    sys.modules.setdefault(PACKAGE, package)
+    return importlib.import_module(f"{PACKAGE}.ocr_engine")
+
+
+engine = _load_engine()
+
+
+def reference_merge(regions, factor):
+    """
+    The original implementation, unchanged except that it also returns the
+    union-find groups (index lists in output order).
+    """
+    if len(regions) < 2:
+        return regions, [[i] for i in range(len(regions))]
+
+    avg_h = sum(r['height'] for r in regions) / len(regions)
+    threshold = avg_h * factor
+
+    parent = list(range(len(regions)))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(a, b):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[ra] = rb
+
+    for i, r1 in enumerate(regions):
+        r1_right = r1['left'] + r1['width']
+        for j in range(i + 1, len(regions)):
+            r2 = regions[j]
+            gap = r2['top'] - (r1['top'] + r1['height'])
+            if gap < 0 or gap >= threshold:
+                continue
+
+            r2_right = r2['left'] + r2['width']
+            overlap_left = max(r1['left'], r2['left'])
+            overlap_right = min(r1_right, r2_right)
+            overlap_w = max(0, overlap_right - overlap_left)
+            min_w = min(r1['width'], r2['width'])
+            offset = abs(r2['left'] - r1['left'])
+
+            if overlap_w > min_w * 0.3 or offset < min_w:
+                union(i, j)
+
+    groups = {}
+    members = {}
+    for i in range(len(regions)):
+        root = find(i)
+        groups.setdefault(root, []).append(regions[i])
+        members.setdefault(root, []).append(i)
+
+    merged = []
+    for group in groups.values():
+        if len(group) == 1:
+            merged.append(group[0])
+        else:
+            merged.append({
+                'left': min(r['left'] for r in group),
+                'top': min(r['top'] for r in group),
+                'width': max(r['left'] + r['width'] for r in group) - min(r['left'] for r in group),
+                'height': max(r['top'] + r['height'] for r in group) - min(r['top'] for r in group),
+            })
+
+    return merged, list(members.values())
+
+
+class Columns:
+    """Float regions in the columnar shape _merge_groups reads."""
+
+    def __init__(self, boxes):
+        self.left = [b[0] for b in boxes]
+        self.top = [b[1] for b in boxes]
+        self.width = [b[2] for b in boxes]
+        self.height = [b[3] for b in boxes]
+
+    def __len__(self):
+        return len(self.left)
+
+
+def random_boxes(rnd, as_float):
+    """Labels in a few columns, dense enough that many pairs are close."""
+    n = rnd.randrange(0, 60)
+    size = rnd.choice((200, 800, 3000))
+    boxes = []
+    for _ in range(n):
+        if as_float:
+            box = (rnd.uniform(0, size), rnd.uniform(0, size),
+                   rnd.uniform(0.5, size / 4), rnd.uniform(0.5, 40))
+        else:
+            box = (rnd.randrange(size), rnd.randrange(size),
+                   rnd.randrange(1, size // 4), rnd.randrange(1, 40))
+        boxes.append(box)
+    # Stacked multi-line labels, the case merging exists for
+    for _ in range(rnd.randrange(0, 10)):
+        left, top = rnd.randrange(size), rnd.randrange(size)
+        for _ in range(rnd.randrange(2, 5)):
+            width, height = rnd.randrange(5, 120), rnd.randrange(8, 30)
+            boxes.append((left + rnd.randrange(-10, 10), top, width, height))
+            top += height + rnd.randrange(-2, 20)
+    rnd.shuffle(boxes)
+    return boxes
+
+
+def to_dicts(boxes):
+    return [dict(zip(('left', 'top', 'width', 'height'), box)) for box in boxes]
+
+
+@pytest.mark.parametrize("factor", FACTORS)
+def test_integer_regions_match_reference(factor):
+    rnd = random.Random(f"int-{factor}")
+    for _ in range(CASES):
+        boxes = random_boxes(rnd, as_float=False)
+        regions = engine.RegionArray()
+        for box in boxes:
+            regions.append(*box)
+
+        expected, expected_groups = reference_merge(to_dicts(boxes), factor)
+        if len(boxes) >= 2:
+            assert engine._merge_groups(regions, factor) == expected_groups
+        assert engine._merge_vertically_close(regions, factor).to_dicts() == expected
+
+
+@pytest.mark.parametrize("factor", FACTORS)
+def test_float_regions_match_reference(factor):
+    rnd = random.Random(f"float-{factor}")
+    for _ in range(CASES):
+        boxes = random_boxes(rnd, as_float=True)
+        _, expected_groups = reference_merge(to_dicts(boxes), factor)
+        if len(boxes) >= 2:
+            assert engine._merge_groups(Columns(boxes), factor) == expected_groups
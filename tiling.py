@@ -0,0 +1,195 @@
+"""
+Tiling Module
+Splits large images into overlapping tiles so OCR can use every core
+
+Architecture:
+- Geometry: tiles overlap by a fixed band; each tile also has a "core" ending
+  halfway through each overlap band. Cores partition the image exactly.
+- Ownership: a word belongs to the tile whose core contains its centre, so a
+  word seen twice in an overlap band is kept once
+- Blank tiles: skipped after a histogram ink-density check (no OCR call)
+- Numbering: block numbers are offset per tile so (block, par, line) keys
+  stay unique when tile results are merged
+- Seams: lines cut by a vertical seam are stitched back together after
+  grouping, before filtering (neighbours found through a spatial.GridIndex)
+"""
+
+import math
+from collections import namedtuple
+
+from .ocr_data import WordTable
+from .spatial import GridIndex
+
+Tile = namedtuple("Tile", ["box", "core"])
+
+# Block numbers of tile i start at i * BLOCK_STRIDE
+BLOCK_STRIDE = 10000
+
+# Gray levels a pixel must differ from the background to count as ink
+INK_CONTRAST = 48
+MIN_INK_RATIO = 0.001
+
+
+def _spans(length, tile, overlap):
+    """Split one axis into (start, end, core_start, core_end) spans."""
+    if length <= tile:
+        return [(0, length, 0, length)]
+
+    count = math.ceil((length - overlap) / (tile - overlap))
+    stride = (length - tile) / (count - 1)
+    starts = [round(i * stride) for i in range(count)]
+
+    spans = []
+    for i, start in enumerate(starts):
+        end = min(start + tile, length)
+        core_start = 0 if i == 0 else (start + starts[i - 1] + tile) // 2
+        core_end = length if i == count - 1 else (starts[i + 1] + end) // 2
+        spans.append((start, end, core_start, core_end))
+    return spans
+
+
+def plan_tiles(width, height, tile_size, overlap):
+    """
+    Lay out overlapping tiles covering a width x height image.
+
+    Returns:
+        List of Tile(box, core), both as (left, top, right, bottom)
+    """
+    overlap = max(0, min(overlap, tile_size // 2))
+    tiles = []
+    for top, bottom, core_top, core_bottom in _spans(height, tile_size, overlap):
+        for left, right, core_left, core_right in _spans(width, tile_size, overlap):
+            tiles.append(Tile(
+                box=(left, top, right, bottom),
+                core=(core_left, core_top, core_right, core_bottom),
+            ))
+    return tiles
+
+
+def plan_bands(width, height, band_size, overlap):
+    """
+    Lay out full-width horizontal bands (overlapping like tiles) covering
+    the image; used to stream results top to bottom.
+
+    Returns:
+        List of Tile(box, core)
+    """
+    overlap = max(0, min(overlap, band_size // 2))
+    return [
+        Tile(box=(0, top, width, bottom), core=(0, core_top, width, core_bottom))
+        for top, bottom, core_top, core_bottom in _spans(height, band_size, overlap)
+    ]
+
+
+def vertical_seams(tiles):
+    """x positions where horizontally adjacent tile cores meet."""
+    return sorted({t.core[0] for t in tiles if t.core[0] > 0})
+
+
+def has_ink(image):
+    """Cheap blank-tile check: share of pixels far from the dominant gray level."""
+    histogram = image.convert("L").histogram()
+    background = max(range(256), key=histogram.__getitem__)
+    ink = sum(
+        count for level, count in enumerate(histogram)
+        if abs(level - background) > INK_CONTRAST
+    )
+    total = image.size[0] * image.size[1]
+    return total > 0 and ink / total >= MIN_INK_RATIO
+
+
+def merge_tile_data(tiles, results):
+    """
+    Merge per-tile word tables into one image-wide WordTable.
+
+    Args:
+        tiles: Tiles from plan_tiles
+        results: WordTable per tile (None for skipped tiles)
+
+    Returns:
+        WordTable in global coordinates, with seams set to the vertical
+        seam positions for stitch_seams
+    """
+    merged = WordTable()
+    for index, (tile, words) in enumerate(zip(tiles, results)):
+        if not words:
+            continue
+
+        offset_x, offset_y = tile.box[0], tile.box[1]
+        core_left, core_top, core_right, core_bottom = tile.core
+        block_offset = index * BLOCK_STRIDE
+
+        for block, par, line, left, top, width, height, conf, text_len in words.rows():
+            left += offset_x
+            top += offset_y
+            cx = left + width / 2
+            cy = top + height / 2
+            if not (core_left <= cx < core_right and core_top <= cy < core_bottom):
+                continue
+            merged.append(block + block_offset, par, line,
+                          left, top, width, height, conf, text_len)
+
+    merged.seams = vertical_seams(tiles)
+    return merged
+
+
+def near_seam(box, seams):
+    """
+    True if a line box (left, top, right, bottom) is within a couple of line
+    heights of a seam; only such lines can need stitching.
+    """
+    left, top, right, bottom = box
+    margin = 2 * (bottom - top)
+    return any(left - margin <= x <= right + margin for x in seams)
+
+
+def stitch_seams(lines, seams):
+    """
+    Join line fragments that a vertical tile seam split in two.
+
+    Two fragments from different tiles are joined when they share a row
+    (vertical overlap of at least half the shorter one), sit on either side
+    of a seam, and the horizontal gap is below one line height.
+
+    Args:
+        lines: ocr_data.LineTable, updated in place
+        seams: Seam x positions from merge_tile_data
+    """
+    if not seams or len(lines) < 2:
+        return lines
+
+    def box(k):
+        return lines.left[k], lines.top[k], lines.right[k], lines.bottom[k]
+
+    candidates = sorted(
+        (k for k in range(len(lines)) if near_seam(box(k), seams)), key=lines.left.__getitem__
+    )
+    index = GridIndex(box(k) for k in candidates)
+    reach = max((lines.bottom[k] - lines.top[k] for k in candidates), default=0)
+
+    joined = set()
+    for pos, a in enumerate(candidates):
+        if a in joined:
+            continue
+        al, at, ar, ab = box(a)
+        # Fragments further right on the same row, within one line height
+        for other in sorted(index.query((al, at, ar + reach, ab))):
+            b = candidates[other]
+            if other <= pos or b in joined:
+                continue
+            if lines.keys[a][0] // BLOCK_STRIDE == lines.keys[b][0] // BLOCK_STRIDE:
+                continue
+            al, at, ar, ab = box(a)
+            bl, bt, br, bb = box(b)
+            height = max(ab - at, bb - bt)
+            v_overlap = min(ab, bb) - max(at, bt)
+            gap = bl - ar
+            if v_overlap < min(ab - at, bb - bt) * 0.5 or not -height <= gap <= height:
+                continue
+            if not any(al <= x <= br for x in seams):
+                continue
+
+            lines.absorb(a, b)
+            joined.add(b)
+
+    return lines
@@ -0,0 +1,231 @@
+"""
+Tracing Module
+Per-request stage timings for the detection pipeline
+
+Architecture:
+- Trace: one record per detection request (from the button press to the
+  last shape on the canvas), holding stage durations in milliseconds plus
+  a few facts about the request (image size, region counts, cache hit/miss)
+- Spans: `with span("stage"):` adds elapsed time to the trace that is
+  current on this thread; outside a trace it costs next to nothing, so the
+  pipeline can be instrumented unconditionally (batch runs aren't traced)
+- Threading: the trace is made current on the worker thread that runs the
+  job (activate); stages that repeat (e.g. a retry with pixels) accumulate
+- JS: the injected script times its own canvas encode and shape creation
+  and reports them with the completion message, which finishes the trace
+- Output: JSON lines in user_files/traces.log (rotated), summarized from
+  Tools > Auto Image Occlusion Timings
+"""
+
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+LOG_PATH = os.path.join(os.path.dirname(__file__), "user_files", "traces.log")
+LOG_MAX_BYTES = 512 * 1024
+LOG_BACKUPS = 2
+
+# Traces whose completion message never arrives (editor closed mid-request)
+# are written out once this many newer ones are open
+MAX_OPEN_TRACES = 16
+
+_local = threading.local()
+_lock = threading.Lock()
+_open_traces = OrderedDict()  # trace id -> Trace
+_logger = None
+
+
+class Trace:
+    """Timings and facts collected for one detection request."""
+
+    def __init__(self, trace_id):
+        self.id = trace_id
+        self.started = time.time()
+        self.stages = {}
+        self.info = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, ms):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+    def note(self, **info):
+        with self._lock:
+            self.info.update(info)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'id': self.id,
+                'time': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+                'stages': {k: round(v, 1) for k, v in self.stages.items()},
+                **self.info,
+            }
+
+
+def begin(trace_id):
+    """Return the open trace for trace_id, creating it on first use."""
+    if not trace_id:
+        return None
+    with _lock:
+        trace = _open_traces.get(trace_id)
+        if trace is None:
+            trace = _open_traces[trace_id] = Trace(trace_id)
+        stale = []
+        while len(_open_traces) > MAX_OPEN_TRACES:
+            stale.append(_open_traces.popitem(last=False)[1])
+    for old in stale:
+        old.note(status='abandoned')
+        _write(old)
+    return trace
+
+
+def finish(trace_id, status, js_stages=None, **info):
+    """Close a trace with the timings reported by JS and write it to the log."""
+    with _lock:
+        trace = _open_traces.pop(trace_id, None)
+    if trace is None:
+        return
+    for stage, ms in (js_stages or {}).items():
+        if isinstance(ms, (int, float)):
+            trace.add(stage, ms)
+    trace.note(status=status, **info)
+    _write(trace)
+
+
+@contextmanager
+def activate(trace):
+    """Make trace current on this thread for the duration of the block."""
+    previous = getattr(_local, 'trace', None)
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def span(stage):
+    """Add the block's wall time to the current trace (if any) under stage."""
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(stage, (time.perf_counter() - start) * 1000)
+
+
+def note(**info):
+    """Attach facts (sizes, counts, cache result) to the current trace."""
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.note(**info)
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+        logger = logging.getLogger("auto_image_occlusion.trace")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handler = RotatingFileHandler(
+            LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+
+def _write(trace):
+    try:
+        _get_logger().info(json.dumps(trace.to_dict(), separators=(",", ":")))
+    except OSError as e:
+        print(f"[Auto Image Occlusion] Failed to write trace: {e}")
+
+
+def load_records(limit=200):
+    """Return up to limit most recent trace records, oldest first."""
+    paths = [f"{LOG_PATH}.{n}" for n in range(LOG_BACKUPS, 0, -1)] + [LOG_PATH]
+    records = []
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            continue
+    return records[-limit:]
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(records, cache_stats=None):
+    """
+    Plain-text table of per-stage median/p90/max over records.
+
+    Args:
+        cache_stats: ocr_cache.stats() for a line on this session's cache use
+    """
+    if not records:
+        return "No detection requests recorded yet."
+
+    stages = {}
+    for record in records:
+        for stage, ms in record.get('stages', {}).items():
+            stages.setdefault(stage, []).append(ms)
+
+    cache = [r.get('cache') for r in records if r.get('cache') in ('hit', 'miss')]
+    hits = cache.count('hit')
+
+    lines = [
+        f"Last {len(records)} detection requests ({LOG_PATH})",
+        f"Cache hits: {hits}/{len(cache)}" if cache else "Cache hits: n/a",
+    ]
+    if cache_stats is not None:
+        lines.append(
+            f"Cache this session: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+            f"{cache_stats['bytes'] / (1024 * 1024):.1f} MB on disk"
+        )
+    lines += [
+        "",
+        f"{'stage':<14}{'median':>10}{'p90':>10}{'max':>10}   (ms)",
+    ]
+    for stage, values in sorted(stages.items(), key=lambda kv: -statistics.median(kv[1])):
+        lines.append(
+            f"{stage:<14}{statistics.median(values):>10.1f}"
+            f"{_percentile(values, 0.9):>10.1f}{max(values):>10.1f}"
+        )
+
+    last = records[-1]
+    lines += ["", "Most recent:", json.dumps(last, indent=2)]
+    return "\n".join(lines)
+
+
+def show_summary():
+    """Tools menu action: show the timing summary."""
+    from aqt.utils import showText
+
+    from . import ocr_cache
+
+    showText(summarize(load_records(), ocr_cache.stats()), title="Auto Image Occlusion Timings", plain_text_edit=True)
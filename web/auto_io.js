@@ -0,0 +1,889 @@
+
+/*
+ * Auto Image Occlusion - Image Occlusion editor script
+ *
+ * Served from the add-on's web exports (/_addons/<package>/web/auto_io.js)
+ * and loaded once per editor webview, so it is parsed and compiled once.
+ * Every image load only calls AutoIOAddon.init(config) through the small
+ * loader built by js_builder.py.
+ *
+ * Architecture:
+ * - Single global namespace (window.AutoIOAddon)
+ * - Function interception for persistence (resetIOImage)
+ * - MutationObserver for initial button addition
+ * - Canvas fallback uploads PNG bytes encoded off the main thread (Worker +
+ *   OffscreenCanvas.convertToBlob, or async canvas.toBlob) in bounded base64
+ *   chunks instead of one multi-MB data URL inside the request JSON
+ * - Two toolbar buttons: detect on the whole image, and detect in a dragged
+ *   selection (an overlay above fabric's canvas, so the active IO tool never
+ *   sees the drag)
+ * - Document-level listeners are registered once, when the script loads;
+ *   init() is idempotent (safe to call on every image load)
+ */
+(function() {
+    'use strict';
+
+
+    // =========================================================================
+    // NAMESPACE - Single global object for all addon state
+    // =========================================================================
+
+    // Already loaded in this webview (e.g. the loader raced itself)
+    if (window.AutoIOAddon && window.AutoIOAddon.init) {
+        return;
+    }
+
+    window.AutoIOAddon = {
+        observer: null,              // MutationObserver for initial button addition
+        resetIntercepted: false,     // Track if we've wrapped resetIOImage
+        ocrPending: false,           // Prevent concurrent OCR requests
+        cancelPending: null,         // Cancels the in-flight OCR request or upload, if any
+        imageGeneration: 0,          // Bumped on every resetIOImage (new image)
+        cancelSelection: null        // Ends an active selection drag, if any
+    };
+
+    const addon = window.AutoIOAddon;
+
+    const DEFAULT_CONFIG = {
+        topPaddingPercent: 0.10, // Add 10% padding on top of detected boxes
+        ocrTimeout: 30000,       // 30 second timeout for OCR operations
+        debounceDelay: 100,      // Debounce delay for MutationObserver (ms)
+        resetDelay: 200,         // Delay after IO reset before re-adding button (ms)
+        shortcut: 'Ctrl+Shift+X',
+        ready: true              // False while dependencies install
+    };
+
+    addon.config = Object.assign({}, DEFAULT_CONFIG);
+
+    // Called by the loader on every image load with the add-on's settings
+    // (shortcut, ready); a saved config applies to the next image
+    addon.init = function(config) {
+        addon.config = Object.assign({}, DEFAULT_CONFIG, config);
+        shortcut = parseShortcut(addon.config.shortcut);
+
+        const btn = document.getElementById('auto-detect-btn');
+        if (btn && addon.config.ready) {
+            btn.title = `Auto-detect text regions (${addon.config.shortcut})`;
+        }
+
+        if (document.readyState === 'loading') {
+            document.addEventListener('DOMContentLoaded', waitForIO, { once: true });
+        } else {
+            waitForIO();
+        }
+    };
+
+    // Called from Python when a background dependency install finishes
+    addon.setReady = function() {
+        addon.config.ready = true;
+        const btn = document.getElementById('auto-detect-btn');
+        if (btn) {
+            btn.title = `Auto-detect text regions (${addon.config.shortcut})`;
+            setButtonState(btn, false, 'normal');
+        }
+        const roiBtn = document.getElementById('auto-detect-roi-btn');
+        if (roiBtn) {
+            roiBtn.title = ROI_TITLE;
+            setButtonState(roiBtn, false, 'normal');
+        }
+    };
+
+    const ROI_TITLE = 'Auto-detect text in a selection (drag a rectangle)';
+
+
+    // =========================================================================
+    // INTERCEPTION - Hook into Anki's resetIOImage function
+    // =========================================================================
+
+    function interceptReset() {
+        // Only intercept once to avoid nested wrappers
+        if (addon.resetIntercepted) {
+            return;
+        }
+
+        // Check if the function exists (it's created when IO editor loads)
+        // Anki exposes this as globalThis.resetIOImage in mask-editor.ts
+        if (typeof globalThis.resetIOImage !== 'function') {
+            return;
+        }
+
+        // Store original function and wrap it
+        const originalReset = globalThis.resetIOImage;
+        globalThis.resetIOImage = function(...args) {
+            // The image is being replaced; results for the old one are useless
+            addon.imageGeneration += 1;
+            if (addon.cancelPending) {
+                addon.cancelPending('Image changed');
+            }
+            if (addon.cancelSelection) {
+                addon.cancelSelection();
+            }
+
+            // Call original function first
+            originalReset.apply(this, args);
+
+            // Re-add button after toolbar is rebuilt
+            console.log('[Auto-IO] IO editor reset detected, re-adding button');
+            setTimeout(() => {
+                waitForIO();
+            }, addon.config.resetDelay);
+        };
+
+        addon.resetIntercepted = true;
+        console.log('[Auto-IO] Successfully intercepted resetIOImage');
+    }
+
+
+    // =========================================================================
+    // INITIALIZATION - Wait for IO editor and add button
+    // =========================================================================
+
+    function waitForIO() {
+        // Try to intercept reset function if not already done
+        interceptReset();
+
+        function checkAndAddButton() {
+            // If button already exists, clean up observer and exit
+            if (document.getElementById('auto-detect-btn')) {
+                if (addon.observer) {
+                    addon.observer.disconnect();
+                    addon.observer = null;
+                }
+                return;
+            }
+
+            // Check if all required IO components are available
+            const toolbar = document.querySelector('.top-tool-bar-container');
+            const canvas = globalThis.canvas;
+            const maskEditor = globalThis.maskEditor;
+
+            if (toolbar && canvas && maskEditor) {
+                addButton();
+
+                // Clean up observer after successful button addition
+                if (addon.observer) {
+                    addon.observer.disconnect();
+                    addon.observer = null;
+                }
+            }
+        }
+
+        // Try immediate addition first
+        checkAndAddButton();
+
+        // If button wasn't added, watch for DOM changes
+        if (!document.getElementById('auto-detect-btn') && !addon.observer) {
+            let debounceTimeout;
+
+            addon.observer = new MutationObserver(() => {
+                // Debounce: only check after DOM stops changing
+                clearTimeout(debounceTimeout);
+                debounceTimeout = setTimeout(checkAndAddButton, addon.config.debounceDelay);
+            });
+
+            // Observe the image-occlusion container (Anki's actual DOM structure)
+            // Falls back to document.body if the container doesn't exist yet
+            const targetElement = document.querySelector('.image-occlusion')
+                || document.querySelector('.editor-main')
+                || document.body;
+            addon.observer.observe(targetElement, {
+                childList: true,
+                subtree: true
+            });
+        }
+    }
+
+
+    // =========================================================================
+    // UI - Add auto-detect button to toolbar
+    // =========================================================================
+
+    function addButton() {
+        const toolbar = document.querySelector('.top-tool-bar-container');
+        if (!toolbar) {
+            console.warn('[Auto-IO] Toolbar not found');
+            return;
+        }
+
+        // Check if button already exists (idempotent)
+        if (document.getElementById('auto-detect-btn')) {
+            return;
+        }
+
+        // Magic wand / auto-fix icon for distinctiveness (mdiAutoFix)
+        const btn = createToolButton(
+            'auto-detect-btn',
+            `Auto-detect text regions (${addon.config.shortcut})`,
+            'M7.5,5.6L5,7L6.4,4.5L5,2L7.5,3.4L10,2L8.6,4.5L10,7L7.5,5.6M19.5,15.4L22,14L20.6,16.5L22,19L19.5,17.6L17,19L18.4,16.5L17,14L19.5,15.4M22,2L20.6,4.5L22,7L19.5,5.6L17,7L18.4,4.5L17,2L19.5,3.4L22,2M13.34,12.78L15.78,10.34L13.66,8.22L11.22,10.66L13.34,12.78M14.37,7.29L16.71,9.63C17.1,10 17.1,10.65 16.71,11.04L5.04,22.71C4.65,23.1 4,23.1 3.63,22.71L1.29,20.37C0.9,20 0.9,19.35 1.29,18.96L12.96,7.29C13.35,6.9 14,6.9 14.37,7.29Z',
+            () => autoDetect()
+        );
+
+        // Dashed selection with a magnifier (mdiSelectionSearch)
+        const roiBtn = createToolButton(
+            'auto-detect-roi-btn',
+            ROI_TITLE,
+            'M15.5,13H16.29L21.29,18L19.79,19.5L14.79,14.5V13.71L14.5,13.42C13.38,14.38 11.89,15 10.25,15C6.66,15 3.75,12.09 3.75,8.5C3.75,4.91 6.66,2 10.25,2C13.84,2 16.75,4.91 16.75,8.5C16.75,10.14 16.13,11.63 15.17,12.75L15.5,13M10.25,4C7.76,4 5.75,6 5.75,8.5C5.75,11 7.76,13 10.25,13C12.75,13 14.75,11 14.75,8.5C14.75,6 12.75,4 10.25,4M2,16H4V18H6V20H2V16M9,20V18H12V20H9M15,20V18H17V20H15M2,13H4V15H2V13Z',
+            detectInSelection
+        );
+
+        if (!addon.config.ready) {
+            for (const button of [btn, roiBtn]) {
+                button.title = 'Installing OCR dependencies...';
+                setButtonState(button, true, 'loading');
+            }
+        }
+
+        // Add to toolbar at the end
+        for (const button of [btn, roiBtn]) {
+            // Container matching Anki's style
+            const container = document.createElement('div');
+            container.className = 'tool-button-container';
+            container.appendChild(button);
+            toolbar.appendChild(container);
+        }
+
+        console.log('[Auto-IO] Button added successfully');
+    }
+
+    // Helper: Create a button matching Anki's IconButton style
+    function createToolButton(id, title, iconPath, onClick) {
+        const btn = document.createElement('button');
+        btn.className = 'top-tool-icon-button border-radius';
+        btn.id = id;
+        btn.title = title;
+        btn.type = 'button';
+
+        // Ensure button matches the height of other toolbar buttons
+        btn.style.height = '100%';
+        btn.style.aspectRatio = '1';
+        btn.style.display = 'flex';
+        btn.style.alignItems = 'center';
+        btn.style.justifyContent = 'center';
+
+        // Match the icon size used by other toolbar buttons
+        const iconSize = 100; // Default iconSize for toolbar buttons
+
+        btn.innerHTML = `
+            <svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" style="width: ${iconSize}%; height: ${iconSize}%;">
+                <path fill="currentColor" d="${iconPath}" />
+            </svg>
+        `;
+
+        btn.addEventListener('click', onClick);
+        return btn;
+    }
+
+    // Helper: Set button visual state
+    function setButtonState(btn, disabled, state) {
+        if (!btn) return;
+
+        btn.disabled = disabled;
+
+        if (state === 'loading') {
+            btn.style.opacity = '0.6';
+            btn.style.cursor = 'wait';
+        } else {
+            btn.style.opacity = '1';
+            btn.style.cursor = 'pointer';
+        }
+    }
+
+    // Global keyboard shortcut (configurable)
+    function parseShortcut(str) {
+        const parts = str.toLowerCase().split('+');
+        const key = parts.pop();
+        return {
+            ctrl: parts.includes('ctrl'),
+            shift: parts.includes('shift'),
+            alt: parts.includes('alt'),
+            meta: parts.includes('meta') || parts.includes('cmd'),
+            key: key
+        };
+    }
+
+    let shortcut = parseShortcut(addon.config.shortcut);
+
+    // Registered once per webview; init() only swaps the parsed shortcut
+    document.addEventListener('keydown', (e) => {
+        if (e.ctrlKey === shortcut.ctrl
+            && e.shiftKey === shortcut.shift
+            && e.altKey === shortcut.alt
+            && e.metaKey === shortcut.meta
+            && e.key.toLowerCase() === shortcut.key) {
+            e.preventDefault();
+            const btn = document.getElementById('auto-detect-btn');
+            if (btn && !btn.disabled) {
+                autoDetect();
+            }
+        }
+    });
+
+
+    // =========================================================================
+    // OCR - Auto-detection orchestration
+    // =========================================================================
+
+    // roi: optional normalized {left, top, width, height} to detect in
+    async function autoDetect(roi) {
+        // Check if editor is ready
+        if (!globalThis.canvas || !globalThis.maskEditor) {
+            alert('Image Occlusion editor not ready');
+            return;
+        }
+
+        // Prevent concurrent OCR requests
+        if (addon.ocrPending) {
+            return;
+        }
+
+        const buttons = [
+            document.getElementById('auto-detect-btn'),
+            document.getElementById('auto-detect-roi-btn')
+        ];
+        buttons.forEach(btn => setButtonState(btn, true, 'loading'));
+        addon.ocrPending = true;
+
+        // One trace per detection; Python adds its own stages under the same id
+        const trace = {
+            id: newId(),
+            started: performance.now(),
+            timings: {}
+        };
+        let status = 'error';
+        let count = 0;
+        let batches = 0;
+        const generation = addon.imageGeneration;
+
+        try {
+            const canvas = globalThis.canvas;
+            const maskEditor = globalThis.maskEditor;
+
+            // Get image element and dimensions
+            const imageElement = document.getElementById('image');
+            if (!imageElement || !imageElement.complete || !imageElement.naturalWidth) {
+                throw new Error('Image not loaded');
+            }
+
+            const imageWidth = imageElement.naturalWidth;
+            const imageHeight = imageElement.naturalHeight;
+
+            // Get canvas bounding box
+            const boundingBox = canvas.getObjects().find(obj => obj['id'] === 'boundingBox');
+            if (!boundingBox) {
+                throw new Error('Bounding box not found');
+            }
+
+            const boundingRect = boundingBox.getBoundingRect();
+
+            // Collision filtering is done (only) in Python, against the
+            // existingShapes sent with the request, so every batch can be
+            // added as it arrives
+            trace.timings.js_shapes = 0;
+            const place = (regions) => {
+                // Boxes for an image that has since been replaced
+                if (regions.length === 0 || addon.imageGeneration !== generation) {
+                    return;
+                }
+
+                // Transform coordinates from image space to canvas space
+                const scaledRegions = scaleRegions(regions, imageWidth, imageHeight, boundingRect);
+
+                // Add shapes to canvas (one batch per call)
+                const shapesStarted = performance.now();
+                addShapes(maskEditor, scaledRegions, boundingBox, boundingRect);
+                trace.timings.js_shapes += performance.now() - shapesStarted;
+                batches += 1;
+
+                if (count === 0) {
+                    trace.timings.js_first_shapes = performance.now() - trace.started;
+                }
+                count += scaledRegions.length;
+            };
+
+            // Run OCR to detect text regions; partial batches are placed
+            // while the rest of the image is still being processed
+            place(await detectText(imageElement, trace, roi, place));
+
+            if (count === 0) {
+                status = 'empty';
+                alert('No text regions detected or all regions already have occlusions');
+                return;
+            }
+
+            status = 'complete';
+
+        } catch (error) {
+            if (error.cancelled) {
+                status = 'cancelled';
+                console.log('[Auto-IO] Auto-detection cancelled:', error.message);
+                if (error.message === 'OCR timeout') {
+                    alert('Auto-detection timed out');
+                }
+            } else {
+                console.error('[Auto-IO] Auto-detection failed:', error);
+                alert('Auto-detection failed: ' + error.message);
+            }
+        } finally {
+            buttons.forEach(btn => setButtonState(btn, false, 'normal'));
+            addon.ocrPending = false;
+
+            // Notify completion (shows the tooltip and closes the trace)
+            trace.timings.js_total = performance.now() - trace.started;
+            pycmd('autoDetect:' + JSON.stringify({
+                status: status,
+                count: count,
+                batches: batches,
+                traceId: trace.id,
+                timings: trace.timings
+            }));
+        }
+    }
+
+
+    // =========================================================================
+    // OCR - Detect text using Python backend
+    // =========================================================================
+
+    // onPartial receives the batches Python streams before its final reply
+    async function detectText(imageElement, trace, roi, onPartial) {
+        const generation = addon.imageGeneration;
+        const request = {
+            traceId: trace.id,
+            existingShapes: collectExistingShapes(),
+            imageWidth: imageElement.naturalWidth,
+            imageHeight: imageElement.naturalHeight
+        };
+        if (roi) {
+            request.roi = roi;
+        }
+
+        // Python reads the original file from the media folder when it can,
+        // which avoids a PNG re-encode and a multi-MB base64 string
+        const result = await sendOCRRequest(request, onPartial);
+        if (!result.needImage) {
+            return result.regions || [];
+        }
+
+        // Fallback (e.g. pasted image not yet in media): upload canvas pixels.
+        // This takes seconds for big images, so it is cancellable too: a
+        // reset stops the encoder and nothing is sent for the old image.
+        const upload = { cancelled: null, stop: null };
+        const cancelUpload = (reason) => {
+            upload.cancelled = reason;
+            if (upload.stop) {
+                upload.stop();
+            }
+        };
+        addon.cancelPending = cancelUpload;
+        const encodeStarted = performance.now();
+        try {
+            request.imageUpload = await uploadImage(imageElement, upload);
+        } finally {
+            if (addon.cancelPending === cancelUpload) {
+                addon.cancelPending = null;
+            }
+        }
+        trace.timings.js_encode = performance.now() - encodeStarted;
+
+        if (upload.cancelled || addon.imageGeneration !== generation) {
+            throw cancelledError(upload.cancelled || 'Image changed');
+        }
+        const retry = await sendOCRRequest(request, onPartial);
+        return retry.regions || [];
+    }
+
+    function cancelledError(reason) {
+        const error = new Error(reason);
+        error.cancelled = true;
+        return error;
+    }
+
+    function newId() {
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 8)}`;
+    }
+
+
+    // =========================================================================
+    // UPLOAD - Send canvas pixels as PNG bytes in bounded chunks
+    // =========================================================================
+
+    // Raw bytes per chunk (a multiple of 3, so chunks are padding-free base64)
+    const UPLOAD_CHUNK = 3 * 256 * 1024;
+
+    // Runs in a Worker: PNG-encode the bitmap and read it back as base64
+    // chunks, none of which touches the editor's thread
+    const ENCODE_WORKER = `
+        self.onmessage = async (event) => {
+            const bitmap = event.data.bitmap;
+            const chunkSize = event.data.chunkSize;
+            try {
+                const canvas = new OffscreenCanvas(bitmap.width, bitmap.height);
+                canvas.getContext('2d').drawImage(bitmap, 0, 0);
+                bitmap.close();
+                const blob = await canvas.convertToBlob({ type: 'image/png' });
+                const reader = new FileReaderSync();
+                for (let start = 0; start < blob.size; start += chunkSize) {
+                    const part = blob.slice(start, start + chunkSize);
+                    const url = reader.readAsDataURL(part);
+                    self.postMessage({ data: url.slice(url.indexOf(',') + 1), bytes: part.size });
+                }
+                self.postMessage({ done: true });
+            } catch (error) {
+                self.postMessage({ error: String(error) });
+            }
+        };
+    `;
+
+    // Resolves to the {id, chunks, bytes} descriptor for the OCR request.
+    // control: {cancelled, stop}; once cancelled is set no more chunks are
+    // sent, and stop() (set by the encoder) ends the encoding early
+    async function uploadImage(imageElement, control) {
+        let lastError = null;
+        for (const encode of [encodeInWorker, encodeOnPage]) {
+            // A failed attempt leaves a partial upload behind; start a new one
+            const upload = { id: newId(), chunks: 0, bytes: 0 };
+            const send = (data, bytes) => {
+                if (control.cancelled) {
+                    throw cancelledError(control.cancelled);
+                }
+                pycmd(`autoDetectChunk:${upload.id}:${upload.chunks}:${data}`);
+                upload.chunks += 1;
+                upload.bytes += bytes;
+            };
+            try {
+                await encode(imageElement, send, control);
+                return upload;
+            } catch (error) {
+                if (control.cancelled) {
+                    throw cancelledError(control.cancelled);
+                }
+                console.warn('[Auto-IO] Image encoding failed:', error);
+                lastError = error;
+            } finally {
+                control.stop = null;
+            }
+        }
+        throw lastError;
+    }
+
+    async function encodeInWorker(imageElement, send, control) {
+        if (typeof OffscreenCanvas === 'undefined' || typeof Worker === 'undefined') {
+            throw new Error('OffscreenCanvas not supported');
+        }
+        const bitmap = await createImageBitmap(imageElement);
+
+        return new Promise((resolve, reject) => {
+            const url = URL.createObjectURL(new Blob([ENCODE_WORKER], { type: 'text/javascript' }));
+            const stop = () => {
+                worker.terminate();
+                URL.revokeObjectURL(url);
+            };
+
+            const worker = new Worker(url);
+            worker.onmessage = (event) => {
+                const message = event.data;
+                if (message.error) {
+                    stop();
+                    reject(new Error(message.error));
+                } else if (message.done) {
+                    stop();
+                    resolve();
+                } else {
+                    try {
+                        send(message.data, message.bytes);
+                    } catch (error) {
+                        stop();
+                        reject(error);
+                    }
+                }
+            };
+            worker.onerror = (event) => {
+                stop();
+                reject(new Error(event.message || 'Encoding worker failed'));
+            };
+            control.stop = () => {
+                stop();
+                reject(cancelledError(control.cancelled));
+            };
+
+            // The bitmap is transferred, not copied
+            worker.postMessage({ bitmap: bitmap, chunkSize: UPLOAD_CHUNK }, [bitmap]);
+        });
+    }
+
+    // Fallback where workers are unavailable: toBlob still encodes
+    // asynchronously, unlike toDataURL
+    async function encodeOnPage(imageElement, send) {
+        const canvas = document.createElement('canvas');
+        canvas.width = imageElement.naturalWidth;
+        canvas.height = imageElement.naturalHeight;
+        const ctx = canvas.getContext('2d');
+        ctx.drawImage(imageElement, 0, 0);
+
+        const blob = await new Promise((resolve, reject) => {
+            canvas.toBlob((result) => {
+                if (result) {
+                    resolve(result);
+                } else {
+                    reject(new Error('Canvas encoding failed'));
+                }
+            }, 'image/png');
+        });
+
+        for (let start = 0; start < blob.size; start += UPLOAD_CHUNK) {
+            const part = blob.slice(start, start + UPLOAD_CHUNK);
+            const url = await new Promise((resolve, reject) => {
+                const reader = new FileReader();
+                reader.onload = () => resolve(reader.result);
+                reader.onerror = () => reject(reader.error);
+                reader.readAsDataURL(part);
+            });
+            send(url.slice(url.indexOf(',') + 1), part.size);
+        }
+    }
+
+    function collectExistingShapes() {
+        // Get existing shapes for collision detection (like logseq-anki-sync)
+        const maskEditor = globalThis.maskEditor;
+        const existingShapes = [];
+
+        if (maskEditor) {
+            const shapes = maskEditor.getShapes();
+            for (const shapeOrShapes of shapes) {
+                const shapeList = Array.isArray(shapeOrShapes) ? shapeOrShapes : [shapeOrShapes];
+                for (const shape of shapeList) {
+                    existingShapes.push({
+                        left: shape.left,
+                        top: shape.top,
+                        width: shape.width,
+                        height: shape.height
+                    });
+                }
+            }
+        }
+
+        return existingShapes;
+    }
+
+    function sendOCRRequest(request, onPartial) {
+        // Send to Python and wait for the reply carrying the same requestId
+        const requestId = newId();
+        request.requestId = requestId;
+
+        return new Promise((resolve, reject) => {
+            let timeout;
+
+            const finish = () => {
+                clearTimeout(timeout);
+                delete window.autoIOCallback;
+                addon.cancelPending = null;
+            };
+
+            // Give up on the request and tell Python to stop working on it
+            addon.cancelPending = (reason) => {
+                finish();
+                pycmd(`autoDetectCancel:${JSON.stringify({ requestId })}`);
+                reject(cancelledError(reason));
+            };
+
+            // Set timeout for OCR operation; each partial batch restarts it
+            const armTimeout = () => {
+                clearTimeout(timeout);
+                timeout = setTimeout(() => {
+                    addon.cancelPending('OCR timeout');
+                }, addon.config.ocrTimeout);
+            };
+            armTimeout();
+
+            // Set up callback for Python to call
+            window.autoIOCallback = (result) => {
+                // Late reply to an earlier, abandoned request
+                if (result.requestId !== requestId) {
+                    return;
+                }
+                if (result.partial) {
+                    armTimeout();
+                    if (onPartial) {
+                        onPartial(result.regions || []);
+                    }
+                    return;
+                }
+                finish();
+                if (result.error) {
+                    reject(new Error(result.error));
+                } else {
+                    resolve(result);
+                }
+            };
+
+            pycmd(`autoDetectOCR:${JSON.stringify(request)}`);
+        });
+    }
+
+
+    // =========================================================================
+    // SELECTION - Detect only inside a rectangle the user drags
+    // =========================================================================
+
+    async function detectInSelection() {
+        if (!globalThis.canvas || !globalThis.maskEditor) {
+            alert('Image Occlusion editor not ready');
+            return;
+        }
+        if (addon.ocrPending || addon.cancelSelection) {
+            return;
+        }
+
+        try {
+            const roi = await selectRegion();
+            if (roi) {
+                await autoDetect(roi);
+            }
+        } catch (error) {
+            console.error('[Auto-IO] Selection failed:', error);
+            alert('Auto-detection failed: ' + error.message);
+        }
+    }
+
+    // Resolves to the dragged rectangle, normalized to the image (0-1), or
+    // null if the user pressed Escape or just clicked
+    function selectRegion() {
+        const canvas = globalThis.canvas;
+        const boundingBox = canvas.getObjects().find(obj => obj['id'] === 'boundingBox');
+        if (!boundingBox) {
+            return Promise.reject(new Error('Bounding box not found'));
+        }
+        // Same (viewport) coordinates as getPointer(e, true)
+        const boundingRect = boundingBox.getBoundingRect();
+        const bounds = canvas.upperCanvasEl.getBoundingClientRect();
+
+        return new Promise((resolve) => {
+            const overlay = document.createElement('div');
+            overlay.style.cssText = `position: fixed; left: ${bounds.left}px; top: ${bounds.top}px;`
+                + ` width: ${bounds.width}px; height: ${bounds.height}px; cursor: crosshair; z-index: 1000;`;
+            const marquee = document.createElement('div');
+            marquee.style.cssText = 'position: absolute; display: none; border: 1px dashed currentColor;'
+                + ' background: rgba(128, 128, 128, 0.15); pointer-events: none;';
+            overlay.appendChild(marquee);
+            document.body.appendChild(overlay);
+
+            let start = null;
+
+            const finish = (roi) => {
+                overlay.remove();
+                document.removeEventListener('keydown', onKey, true);
+                addon.cancelSelection = null;
+                resolve(roi);
+            };
+
+            const onKey = (e) => {
+                if (e.key === 'Escape') {
+                    e.preventDefault();
+                    e.stopPropagation();
+                    finish(null);
+                }
+            };
+
+            const drawMarquee = (e) => {
+                marquee.style.left = `${Math.min(start.clientX, e.clientX) - bounds.left}px`;
+                marquee.style.top = `${Math.min(start.clientY, e.clientY) - bounds.top}px`;
+                marquee.style.width = `${Math.abs(e.clientX - start.clientX)}px`;
+                marquee.style.height = `${Math.abs(e.clientY - start.clientY)}px`;
+            };
+
+            overlay.addEventListener('pointerdown', (e) => {
+                start = e;
+                overlay.setPointerCapture(e.pointerId);
+                marquee.style.display = 'block';
+                drawMarquee(e);
+            });
+
+            overlay.addEventListener('pointermove', (e) => {
+                if (start) {
+                    drawMarquee(e);
+                }
+            });
+
+            overlay.addEventListener('pointerup', (e) => {
+                if (!start) {
+                    return;
+                }
+                const a = canvas.getPointer(start, true);
+                const b = canvas.getPointer(e, true);
+                const clamp = (v) => Math.min(Math.max(v, 0), 1);
+                const left = clamp((Math.min(a.x, b.x) - boundingRect.left) / boundingRect.width);
+                const top = clamp((Math.min(a.y, b.y) - boundingRect.top) / boundingRect.height);
+                const right = clamp((Math.max(a.x, b.x) - boundingRect.left) / boundingRect.width);
+                const bottom = clamp((Math.max(a.y, b.y) - boundingRect.top) / boundingRect.height);
+
+                // A click (or a drag outside the image) selects nothing
+                if (right - left < 0.005 || bottom - top < 0.005) {
+                    finish(null);
+                    return;
+                }
+                finish({ left: left, top: top, width: right - left, height: bottom - top });
+            });
+
+            document.addEventListener('keydown', onKey, true);
+            addon.cancelSelection = () => finish(null);
+        });
+    }
+
+
+    // =========================================================================
+    // COORDINATE TRANSFORMATION - Scale regions from image to canvas space
+    // =========================================================================
+
+    function scaleRegions(regions, imageWidth, imageHeight, boundingRect) {
+        const scaledRegions = [];
+
+        for (const region of regions) {
+            // Add configurable top padding
+            const topPadding = region.height * addon.config.topPaddingPercent;
+
+            scaledRegions.push({
+                left: (region.left / imageWidth) * boundingRect.width,
+                top: ((region.top - topPadding) / imageHeight) * boundingRect.height,
+                width: (region.width / imageWidth) * boundingRect.width,
+                height: ((region.height + topPadding) / imageHeight) * boundingRect.height
+            });
+        }
+
+        return scaledRegions;
+    }
+
+
+    // =========================================================================
+    // SHAPE CREATION - Add rectangles to canvas
+    // =========================================================================
+
+    // Bulk insert: fabric's renderOnAddRemove is off while the batch is
+    // added, so there is one render for the batch instead of one per shape.
+    // Each shape's 'object:added' still fires as usual, since the editor's
+    // listeners (undo history, shape bookkeeping) track shapes one by one.
+    function addShapes(maskEditor, regions, boundingBox, boundingRect) {
+        const Rectangle = maskEditor.Rectangle;
+        const canvas = globalThis.canvas;
+
+        const renderOnAddRemove = canvas.renderOnAddRemove;
+        canvas.renderOnAddRemove = false;
+        try {
+            for (const region of regions) {
+                // Normalize coordinates to 0-1 range (required by Anki's API)
+                const normalizedShape = new Rectangle({
+                    left: region.left / boundingRect.width,
+                    top: region.top / boundingRect.height,
+                    width: region.width / boundingRect.width,
+                    height: region.height / boundingRect.height
+                });
+
+                maskEditor.addShape(boundingBox, normalizedShape);
+            }
+        } finally {
+            canvas.renderOnAddRemove = renderOnAddRemove;
+        }
+
+        canvas.requestRenderAll();
+    }
+
+})();